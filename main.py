@@ -1,21 +1,180 @@
+import argparse
+
 import pygame
 
-from pytune import Game, GameBoard
+from pytune import Game, GameBoard, StartupTimer, setup_logging, start_intro_music
 from pytune import WINDOW_HEIGHT, WINDOW_WIDTH
+from pytune.engine import BUZZ_GRACE
+from pytune.logger import init_logger
+from pytune.sound import MIXER_FREQUENCY, mixer_buffer
+
+
+logger = init_logger(__name__)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="PyTune music quiz game.")
+    parser.add_argument(
+        "--backend",
+        choices=["mixer", "stream"],
+        default="mixer",
+        help="playback backend: pygame mixer or low-latency sounddevice stream",
+    )
+    parser.add_argument(
+        "--random-offset",
+        action="store_true",
+        help="start every song from a random point",
+    )
+    parser.add_argument(
+        "--log-level",
+        default=None,
+        help="lowest level of logged messages, e.g. DEBUG, INFO, GAME or HOST",
+    )
+    parser.add_argument(
+        "--journal",
+        default="./pytune-journal.log",
+        help="file where game events are recorded",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the last game recorded in the journal",
+    )
+    parser.add_argument(
+        "--metrics",
+        default="./pytune-metrics.json",
+        help="file where latency and frame time metrics are saved on exit",
+    )
+    parser.add_argument(
+        "--leaderboard",
+        default=None,
+        help="league file where results of every round are kept, "
+        "e.g. ./pytune-leaderboard.sqlite",
+    )
+    parser.add_argument(
+        "--season",
+        default=None,
+        help="league season of the game, the current year by default",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile the game from the start, F9 starts a profile at any time",
+    )
+    parser.add_argument(
+        "--profile-frames",
+        type=int,
+        default=600,
+        help="frames covered by a profile",
+    )
+    parser.add_argument(
+        "--profile-rounds",
+        type=int,
+        default=None,
+        help="rounds covered by a profile, instead of frames",
+    )
+    parser.add_argument(
+        "--remote-port",
+        type=int,
+        default=None,
+        help="accept buzzes from the local network on this UDP port, e.g. 9177",
+    )
+    parser.add_argument(
+        "--buzz-grace",
+        type=float,
+        default=BUZZ_GRACE,
+        help="seconds in which an earlier remote press arriving late still wins",
+    )
+    parser.add_argument(
+        "--fullscreen",
+        action="store_true",
+        help="start in fullscreen at the desktop resolution (F11 toggles it)",
+    )
+    parser.add_argument(
+        "--vsync",
+        action="store_true",
+        help="sync frames with the screen refresh instead of the frame timer",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.015,
+        help="audio latency budget in seconds, sets the mixer buffer size",
+    )
+    parser.add_argument(
+        "--no-sfx",
+        action="store_true",
+        help="do not play buzz and answer sound effects",
+    )
+    return parser.parse_args()
+
+
+def open_window(fullscreen, vsync):
+    """Returns the window and whether vsync could be enabled."""
+    if fullscreen:
+        size, flags = (0, 0), pygame.FULLSCREEN
+    else:
+        size, flags = (WINDOW_WIDTH, WINDOW_HEIGHT), pygame.RESIZABLE
+    if vsync:
+        # Window stays unscaled, so resizing still lays out the board again
+        try:
+            return pygame.display.set_mode(size, flags, vsync=1), True
+        except pygame.error as error:
+            logger.warning("No vsync, frames follow the timer: %s", error)
+    return pygame.display.set_mode(size, flags), False
 
 
 def main():
-    pygame.init()
+    timer = StartupTimer()
+    args = parse_args()
+    setup_logging(args.log_level)
+
+    # Start the intro music first, everything else loads while it plays:
+    with timer.phase("mixer"):
+        buffer = mixer_buffer(args.latency)
+        pygame.mixer.init(frequency=MIXER_FREQUENCY, buffer=buffer)
+        if not args.resume:
+            start_intro_music()
+            timer.mark("intro music")
 
     # Initialize pygame display to handle events
-    window = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-    pygame.display.set_caption("PyTune 0.0.1dev")
+    with timer.phase("display"):
+        pygame.display.init()
+        window, vsync = open_window(args.fullscreen, args.vsync)
+        pygame.display.set_caption("PyTune 0.0.1dev")
+
+    # Song library loads in the background from here on
+    with timer.phase("game"):
+        pygame.joystick.init()
+        folder_path = "./assets/domki2024"  # Change this to your folder path
+        game = Game(
+            path=folder_path,
+            random_order=True,
+            backend=args.backend,
+            random_offset=args.random_offset,
+            journal_path=args.journal,
+            resume=args.resume,
+            metrics_path=args.metrics,
+            remote_port=args.remote_port,
+            buzz_grace=args.buzz_grace,
+            sfx=not args.no_sfx,
+            leaderboard_path=args.leaderboard,
+            season=args.season,
+            profile=args.profile,
+            profile_frames=args.profile_frames,
+            profile_rounds=args.profile_rounds,
+            vsync=vsync,
+        )
 
-    folder_path = "./assets/domki2024"  # Change this to your folder path
-    game = Game(path=folder_path, random_order=True)
-    board = GameBoard(window, game.players)
+    with timer.phase("board"):
+        board = GameBoard(window, game.players)
+        game.draw(board)
+    timer.report()
 
-    game.show_intro(board)
+    if args.resume:
+        game.restore(board)
+    else:
+        game.show_intro(board)
     game.start_game(board)
 
 
@@ -1,4 +1,7 @@
-from .game import Game
+from .game import Game, start_intro_music
 from .graphics import *  # TODO: refactor
+from .logger import setup_logging
+from .metrics import StartupTimer
 from .player import Player
+from .scheduler import FrameScheduler
 from .sound import Sound
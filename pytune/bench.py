@@ -0,0 +1,219 @@
+"""
+Headless simulation and benchmark of the game loop.
+
+Runs Game and GameBoard with SDL dummy video/audio drivers and fake
+joysticks, injects scripted host and buzzer events, and reports
+buzz-to-state-change latency, frame time, CPU per round and rounds
+per second. Usage:
+
+    python -m pytune.bench --players 4 --rounds 200 --seed 0
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pygame
+import soundfile
+
+from .game import Game, GameState
+from .graphics import WINDOW_HEIGHT, WINDOW_WIDTH, GameBoard
+from .logger import setup_logging
+from .scheduler import FrameScheduler
+
+
+class FakeJoystick:
+    """Stands in for pygame.joystick.Joystick in simulations."""
+
+    def __init__(self, instance_id):
+        self.instance_id = instance_id
+        self.initialized = False
+
+    def init(self):
+        self.initialized = True
+
+    def get_init(self):
+        return self.initialized
+
+    def get_name(self):
+        return f"Fake joystick {self.instance_id}"
+
+    def get_instance_id(self):
+        return self.instance_id
+
+    def rumble(self, low_frequency, high_frequency, duration):
+        return True
+
+    def stop_rumble(self):
+        pass
+
+
+def make_songs(folder, count, length=1.0, samplerate=44100):
+    # Short silent songs are enough to drive the game
+    silence = np.zeros((int(length * samplerate), 2), dtype="int16")
+    for number in range(count):
+        # Songs must differ, or they are dropped as copies of one song:
+        silence[0] = divmod(number, 1 << 15)
+        soundfile.write(
+            os.path.join(folder, f"song{number:05}.wav"), silence, samplerate
+        )
+
+
+def key(code):
+    return pygame.event.Event(pygame.KEYDOWN, key=code, mod=0, unicode="")
+
+
+def buzz(player):
+    return pygame.event.Event(pygame.JOYBUTTONDOWN, instance_id=player, button=0)
+
+
+def percentiles(samples):
+    if not samples:
+        return "no samples"
+    p50, p90, p99 = np.percentile(samples, [50, 90, 99]) * 1000
+    return (
+        f"p50 {p50:.3f} ms, p90 {p90:.3f} ms, p99 {p99:.3f} ms, "
+        f"max {max(samples) * 1000:.3f} ms"
+    )
+
+
+class Simulation:
+    def __init__(self, players, seed, paced=False, close_race=0.3):
+        self.rng = random.Random(seed)
+        self.close_race = close_race  # Chance that several players buzz at once
+        self.folder = tempfile.TemporaryDirectory(prefix="pytune-bench-")
+        self.window = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+        self.players = players
+        self.paced = paced
+        self.game = None
+        self.board = None
+        self.state_changed_at = None
+        self.buzz_latencies = []
+        self.frame_times = []
+        self.round_cpu = []
+
+    def setup(self, rounds):
+        make_songs(self.folder.name, rounds + 1)
+        joysticks = [FakeJoystick(number) for number in range(self.players)]
+        # Background analysis would compete with the timed game loop:
+        self.game = Game(
+            self.folder.name,
+            random_order=True,
+            joysticks=joysticks,
+            normalize=False,
+            analyze=False,
+        )
+        if not self.paced:
+            # Never sleep between frames, measure raw throughput
+            self.game.scheduler = FrameScheduler(target_fps=1e9, idle_fps=1e9)
+        self.board = GameBoard(self.window, self.game.players)
+        self.game.activate_board(self.board)
+        # Time every frame:
+        draw = self.board.draw
+
+        def timed_draw(*args, **kwargs):
+            start = time.perf_counter()
+            dirty_rects = draw(*args, **kwargs)
+            self.frame_times += [time.perf_counter() - start]
+            return dirty_rects
+
+        self.board.draw = timed_draw
+        # Note when a buzz changes the game state:
+        listen_to_players = self.game.listen_to_players
+
+        def timed_listen_to_players(event, board):
+            state = self.game.current_state
+            listen_to_players(event, board)
+            if self.game.current_state != state:
+                self.state_changed_at = time.perf_counter()
+
+        self.game.listen_to_players = timed_listen_to_players
+
+    def post(self, *events):
+        for event in events:
+            pygame.event.post(event)
+
+    def step_until(self, condition, limit=100):
+        for _ in range(limit):
+            self.game.step(self.board)
+            if condition():
+                return
+        raise RuntimeError("Game did not reach the expected state!")
+
+    def play_round(self):
+        game = self.game
+        self.post(key(pygame.K_SPACE))
+        self.step_until(lambda: game.current_state == GameState.MUSIC_ROUND)
+        # Players buzz until someone gets points or everyone is out:
+        while game.current_state == GameState.MUSIC_ROUND:
+            active = [
+                player.number
+                for player in game.players
+                if player.number not in game.disabled_players
+            ]
+            if not active:
+                self.post(key(pygame.K_SPACE))
+                self.step_until(lambda: game.current_state == GameState.IDLE)
+                return
+            racing = self.rng.sample(active, len(active))
+            if self.rng.random() >= self.close_race:
+                racing = racing[:1]
+            posted_at = time.perf_counter()
+            self.post(*[buzz(player) for player in racing])
+            self.step_until(lambda: game.current_state == GameState.RANKING_ROUND)
+            self.buzz_latencies += [self.state_changed_at - posted_at]
+            answer = pygame.K_1 if self.rng.random() < 0.6 else pygame.K_0
+            self.post(key(answer))
+            self.step_until(lambda: game.current_state != GameState.RANKING_ROUND)
+
+    def run(self, rounds):
+        self.setup(rounds)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            cpu = time.process_time()
+            self.play_round()
+            self.round_cpu += [time.process_time() - cpu]
+        elapsed = time.perf_counter() - start
+        self.game.sound.close()
+        self.folder.cleanup()
+        return elapsed
+
+    def report(self, rounds, elapsed):
+        print(f"Rounds:            {rounds} in {elapsed:.2f} s")
+        print(f"Rounds per second: {rounds / elapsed:.1f}")
+        print(f"Buzz latency:      {percentiles(self.buzz_latencies)}")
+        print(f"Frame time:        {percentiles(self.frame_times)}")
+        print(
+            f"CPU per round:     {statistics.mean(self.round_cpu) * 1000:.3f} ms "
+            f"(max {max(self.round_cpu) * 1000:.3f} ms)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--paced",
+        action="store_true",
+        help="keep the default frame pacing instead of running flat out",
+    )
+    args = parser.parse_args()
+    setup_logging()
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    pygame.init()
+    simulation = Simulation(args.players, args.seed, paced=args.paced)
+    elapsed = simulation.run(args.rounds)
+    simulation.report(args.rounds, elapsed)
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Rules of the game, free of pygame, sound and drawing.
+
+Engine takes plain inputs and changes its state, then returns effect
+commands which the front end (Game) applies to the sound and the board.
+Without a front end it simulates games very fast, also in a process pool:
+
+    python -m pytune.engine --players 8 --rounds 100000 --sessions 8
+"""
+
+import argparse
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+
+from .player import HostState, PlayerState
+
+# Remote press arriving this long (in seconds) after a later one took
+# the round still wins it, if it was pressed earlier
+BUZZ_GRACE = 0.1
+
+
+class GameState(Enum):
+    ERROR = -1
+    QUIT = 0
+    IDLE = 1
+    INTRO = 2
+    MUSIC_ROUND = 3
+    RANKING_ROUND = 4
+    HOST_ROUND = 5
+    PLAYER_ROUND = 6
+
+
+class Actors(Enum):
+    HOST = -1
+
+
+class Input(Enum):
+    BUZZ = 0  # Player pressed a button
+    SPACE = 1  # Host starts the next song or skips the current one
+    CONTINUE = 2  # Host continues the song
+    PAUSE = 3  # Host pauses the song
+    MINUS = 4  # Host gives a penalty point
+    PLUS = 5  # Host gives a point
+
+
+class Effect(Enum):
+    PAUSE_SONG = 0  # ()
+    CONTINUE_SONG = 1  # ()
+    PLAY_NEXT = 2  # ()
+    HIGHLIGHT_HOST = 3  # (active, host state)
+    HIGHLIGHT_PLAYER = 4  # (player number, active, player state)
+    RESET_PLAYERS = 5  # () all players back to active, not highlighted
+    BUZZED = 6  # (player number, took over from another player), see stopped_at
+    SCORED = 7  # (player number, points delta)
+    SKIPPED = 8  # ()
+
+
+# Effects of inputs, shared by all engines and never modified:
+NO_EFFECTS = ()
+NEXT_SONG_EFFECTS = (
+    (Effect.HIGHLIGHT_HOST, False, HostState.ACTIVE),
+    (Effect.RESET_PLAYERS,),
+    (Effect.PLAY_NEXT,),
+)
+# Host stays highlighted until the next song is played
+SKIP_EFFECTS = (
+    (Effect.HIGHLIGHT_HOST, True, HostState.ACTIVE),
+    (Effect.RESET_PLAYERS,),
+    (Effect.PAUSE_SONG,),
+    (Effect.SKIPPED,),
+)
+CONTINUE_EFFECTS = (
+    (Effect.HIGHLIGHT_HOST, False, HostState.ACTIVE),
+    (Effect.CONTINUE_SONG,),
+)
+# Host stays highlighted until the round is skipped or continued
+PAUSE_EFFECTS = (
+    (Effect.HIGHLIGHT_HOST, True, HostState.ACTIVE),
+    (Effect.PAUSE_SONG,),
+)
+
+
+class PlayerEffects:
+    """Effects of inputs concerning one player, built once per player."""
+
+    def __init__(self, number):
+        answering = (Effect.HIGHLIGHT_PLAYER, number, True, PlayerState.ANSWERING)
+        self.buzz = (
+            (Effect.PAUSE_SONG,),
+            (Effect.BUZZED, number, False),
+            answering,
+            # Host needs to rank the answer:
+            (Effect.HIGHLIGHT_HOST, True, HostState.RANKING),
+        )
+        self.take_over = ((Effect.BUZZED, number, True), answering)
+        self.released = ((Effect.HIGHLIGHT_PLAYER, number, False, PlayerState.ACTIVE),)
+        self.plus = (
+            (Effect.SCORED, number, 1),
+            (Effect.HIGHLIGHT_PLAYER, number, True, PlayerState.WIN),
+            (Effect.HIGHLIGHT_HOST, True, HostState.ACTIVE),
+        )
+        self.minus = (
+            (Effect.SCORED, number, -1),
+            (Effect.HIGHLIGHT_PLAYER, number, False, PlayerState.ELIMINATED),
+            (Effect.HIGHLIGHT_HOST, True, HostState.ACTIVE),
+        )
+
+
+class Engine:
+    """
+    State machine of a game round.
+    Every input returns the effects it caused, a tuple of tuples
+    (Effect, *arguments). Effect tuples are shared between inputs,
+    so handling an input allocates nothing in the common case.
+    """
+
+    def __init__(self, players=0, buzz_grace=BUZZ_GRACE):
+        self.state = GameState.IDLE
+        self.who_stopped = Actors.HOST
+        self.stopped_at = None  # Press time of the player who is answering
+        self.round_counter = 0
+        self.points = [0] * players
+        self.eliminated = [False] * players
+        self._effects = [PlayerEffects(number) for number in range(players)]
+        # Time after a buzz in which an earlier press arriving late still wins
+        self.buzz_grace = buzz_grace
+        self._buzz_taken_at = None
+
+    @property
+    def disabled_players(self):
+        return {number for number, out in enumerate(self.eliminated) if out}
+
+    def add_player(self):
+        self.points += [0]
+        self.eliminated += [False]
+        self._effects += [PlayerEffects(len(self._effects))]
+        return len(self.points) - 1
+
+    def restore(self, points, round_counter):
+        for number, value in points.items():
+            if number < len(self.points):
+                self.points[number] = value
+        self.round_counter = round_counter
+        self.state = GameState.IDLE
+
+    def handle(self, kind, player=None, timestamp=0.0, now=0.0):
+        """Apply an input. Timestamps matter only for buzzes."""
+        state = self.state
+        if kind is Input.BUZZ:
+            if state is GameState.MUSIC_ROUND or state is GameState.RANKING_ROUND:
+                return self.buzz(player, timestamp, now)
+        elif kind is Input.SPACE:
+            if state is GameState.IDLE:
+                return self.next_song()
+            if state is GameState.MUSIC_ROUND:
+                return self.skip_song()
+        elif kind is Input.CONTINUE or kind is Input.PAUSE:
+            # Host controls the music outside of ranking, also during intro:
+            if state is not GameState.RANKING_ROUND:
+                if kind is Input.CONTINUE:
+                    return CONTINUE_EFFECTS
+                return PAUSE_EFFECTS
+        # Points can be given only to a player who stopped the song:
+        elif state is GameState.RANKING_ROUND and self.who_stopped is not Actors.HOST:
+            if kind is Input.MINUS:
+                return self.give_minus()
+            if kind is Input.PLUS:
+                return self.give_plus()
+        return NO_EFFECTS
+
+    def buzz(self, player, timestamp, now):
+        if player >= len(self.eliminated) or self.eliminated[player]:
+            return NO_EFFECTS
+        if self.state is GameState.MUSIC_ROUND:
+            self._take_buzz(player, timestamp, now)
+            return self._effects[player].buzz
+        # Remote press can arrive after a later one already won the round.
+        # Within the grace time the earliest press still takes over:
+        if (
+            player != self.who_stopped
+            and timestamp < self.stopped_at
+            and now - self._buzz_taken_at <= self.buzz_grace
+        ):
+            released = self._effects[self.who_stopped].released
+            self._take_buzz(player, timestamp, now)
+            return released + self._effects[player].take_over
+        return NO_EFFECTS
+
+    def _take_buzz(self, player, timestamp, now):
+        self.who_stopped = player
+        self.stopped_at = timestamp
+        self._buzz_taken_at = now
+        self.state = GameState.RANKING_ROUND
+
+    def next_song(self):
+        # Clear disabled players list:
+        for number in range(len(self.eliminated)):
+            self.eliminated[number] = False
+        self.state = GameState.MUSIC_ROUND
+        self.round_counter += 1
+        return NEXT_SONG_EFFECTS
+
+    def skip_song(self):
+        self.who_stopped = Actors.HOST
+        self.state = GameState.IDLE
+        return SKIP_EFFECTS
+
+    def give_minus(self):
+        player = self.who_stopped
+        self.points[player] -= 1
+        # Others keep playing the round:
+        self.eliminated[player] = True
+        self.who_stopped = Actors.HOST
+        self.state = GameState.MUSIC_ROUND
+        return self._effects[player].minus
+
+    def give_plus(self):
+        player = self.who_stopped
+        self.points[player] += 1
+        self.who_stopped = Actors.HOST
+        self.state = GameState.IDLE
+        return self._effects[player].plus
+
+
+def _random_bytes(rng, size=1 << 16):
+    # Bytes are small ints, which Python never allocates
+    while True:
+        yield from rng.randbytes(size)
+
+
+def simulate(players, rounds, seed=0, correct=0.6):
+    """
+    Play rounds with random buzzes and random host decisions.
+    Returns final points of players.
+    """
+    engine = Engine(players)
+    handle = engine.handle
+    eliminated = engine.eliminated
+    # Random decisions come from a stream of bytes, so events allocate nothing.
+    # Bytes from `limit` up are dropped, the others pick players evenly:
+    draw = _random_bytes(random.Random(seed)).__next__
+    limit = 256 - 256 % players
+    right = round(correct * 256)
+    for _ in range(rounds):
+        handle(Input.SPACE)
+        out = 0
+        while engine.state is GameState.MUSIC_ROUND:
+            # Random player who is still in the round buzzes:
+            player = draw()
+            if player >= limit:
+                continue
+            player %= players
+            if eliminated[player]:
+                continue
+            handle(Input.BUZZ, player)
+            if draw() < right:
+                handle(Input.PLUS)
+            else:
+                handle(Input.MINUS)
+                out += 1
+                if out == players:
+                    handle(Input.SPACE)
+    return engine.points
+
+
+def simulate_many(sessions, players, rounds, seed=0, workers=None):
+    """Simulate independent sessions in a process pool."""
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = [
+            executor.submit(simulate, players, rounds, seed + session)
+            for session in range(sessions)
+        ]
+        return [future.result() for future in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--players", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=100000)
+    parser.add_argument("--sessions", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.sessions == 1:
+        results = [simulate(args.players, args.rounds, args.seed)]
+    else:
+        results = simulate_many(args.sessions, args.players, args.rounds, args.seed)
+    elapsed = time.perf_counter() - start
+    total = args.sessions * args.rounds
+    print(f"Rounds:            {total} in {elapsed:.2f} s")
+    print(f"Rounds per second: {total / elapsed:.0f}")
+    for session, points in enumerate(results):
+        print(f"Session {session}:         points {points}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Detection of duplicate songs in the library.
+
+Every song gets a 64-bit fingerprint of its spectrum, so copies of a
+song are found even if they were encoded differently or got another
+name. Fingerprints are kept in the library index, keyed by file hash,
+so only new or changed files are analyzed. To fingerprint a whole
+library ahead of the game and list its duplicates:
+
+    python -m pytune.fingerprint ./assets/domki2024
+"""
+
+import argparse
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import soundfile
+
+from .library import SongLibrary
+from .logger import init_logger, setup_logging
+
+
+logger = init_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    hash TEXT PRIMARY KEY,
+    fingerprint INTEGER
+);
+"""
+
+# Audio is analyzed at about this rate (in Hz)
+ANALYSIS_RATE = 11025
+# Length of audio analyzed after the leading silence (in seconds)
+ANALYSIS_LENGTH = 60.0
+# Blocks quieter than this (in dB relative to full scale) are silence
+SILENCE_LEVEL = -50.0
+FRAME_SIZE = 4096
+# Fingerprint bits come from differences between 9 spectrum bands
+# and between 9 time segments, 8 x 8 = 64 bits
+BANDS = 9
+SEGMENTS = 9
+LOWEST_FREQUENCY = 100.0
+HIGHEST_FREQUENCY = 5000.0
+# Songs whose fingerprints differ in at most this many bits are copies
+MAX_DISTANCE = 6
+# Durations of copies differ by at most this much (in seconds)
+MAX_DURATION_DIFFERENCE = 3.0
+# Files sent to a worker process at once
+CHUNK_SIZE = 16
+# Copies share at least one of MAX_DISTANCE + 1 bands of fingerprint bits
+KEY_BANDS = MAX_DISTANCE + 1
+# Rows of fingerprints compared with a bucket at once
+COMPARE_BLOCK = 512
+# Songs of close duration compared with a block of rows at most,
+# larger groups of alike songs are skipped
+MAX_COMPARED = 4096
+
+# Number of set bits in every 16-bit value
+POPCOUNT = np.array([bin(value).count("1") for value in range(1 << 16)], np.uint8)
+
+
+def _read_audio(path):
+    """Mono audio from the end of the leading silence, at about ANALYSIS_RATE."""
+    info = soundfile.info(path)
+    step = max(info.samplerate // ANALYSIS_RATE, 1)
+    rate = info.samplerate / step
+    blocksize = int(info.samplerate * 0.1)
+    blocks = []
+    length = 0
+    for block in soundfile.blocks(
+        path, blocksize=blocksize, dtype="float32", always_2d=True
+    ):
+        mono = block.mean(axis=1)
+        if not blocks:
+            power = np.square(mono).mean()
+            if 10 * np.log10(max(power, 1e-12)) < SILENCE_LEVEL:
+                continue
+        # Averaging neighbours is a cheap low pass filter before decimation:
+        usable = len(mono) // step * step
+        blocks += [mono[:usable].reshape(-1, step).mean(axis=1)]
+        length += len(blocks[-1])
+        if length >= ANALYSIS_LENGTH * rate:
+            break
+    if not blocks:
+        return np.zeros(0, dtype=np.float32), rate
+    return np.concatenate(blocks), rate
+
+
+def compute_fingerprint(path):
+    """Returns the 64-bit fingerprint of a song file, or None for silence."""
+    audio, rate = _read_audio(path)
+    if len(audio) < FRAME_SIZE * SEGMENTS:
+        return None
+    # Power spectrum of half overlapping frames:
+    frames = np.lib.stride_tricks.sliding_window_view(audio, FRAME_SIZE)[
+        :: FRAME_SIZE // 2
+    ]
+    spectrum = np.square(np.abs(np.fft.rfft(frames * np.hanning(FRAME_SIZE))))
+    # Energy in log-spaced bands:
+    edges = np.geomspace(LOWEST_FREQUENCY, HIGHEST_FREQUENCY, BANDS + 1)
+    bins = np.searchsorted(np.fft.rfftfreq(FRAME_SIZE, 1 / rate), edges)
+    bands = np.add.reduceat(spectrum, bins[:-1], axis=1)
+    # Mean energy of each band in equal time segments:
+    segments = np.array(
+        [segment.mean(axis=0) for segment in np.array_split(bands, SEGMENTS)]
+    )
+    energy = np.log10(segments + 1e-12)
+    # Bits tell if the difference between neighbouring bands grows in time:
+    band_differences = energy[:, :-1] - energy[:, 1:]
+    bits = (band_differences[1:] - band_differences[:-1]) > 0
+    value = int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+    # Stored as a signed 64-bit integer, the way SQLite keeps integers
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _analyze(path):
+    # Errors are returned, one bad file must not stop the whole batch
+    try:
+        return compute_fingerprint(path), None
+    except (OSError, RuntimeError) as error:
+        return None, str(error)
+
+
+def _band_keys(prints):
+    """Values of KEY_BANDS bands of bits of every fingerprint, by band."""
+    bits = prints.view(np.uint64)
+    keys = []
+    start = 0
+    for band in range(KEY_BANDS):
+        width = (64 - start) // (KEY_BANDS - band)
+        keys += [(bits >> np.uint64(start)) & np.uint64((1 << width) - 1)]
+        start += width
+    return keys
+
+
+def _close_pairs(prints, durations, bucket):
+    """Yield pairs of songs in bucket (positions in prints) which are copies."""
+    # Copies have close durations, so in the order of durations each
+    # row is compared only with the next songs until the durations part:
+    bucket = bucket[np.argsort(durations[bucket], kind="stable")]
+    sorted_durations = durations[bucket]
+    ends = np.searchsorted(
+        sorted_durations, sorted_durations + MAX_DURATION_DIFFERENCE, side="right"
+    )
+    for start in range(0, len(bucket), COMPARE_BLOCK):
+        rows = bucket[start : start + COMPARE_BLOCK]
+        end = ends[start + len(rows) - 1]
+        if end - start > MAX_COMPARED:
+            logger.warning(
+                "Skipping %d songs too alike to compare, e.g. '%.1fs' long",
+                len(rows),
+                sorted_durations[start],
+            )
+            continue
+        others = bucket[start:end]
+        xor = prints[rows][:, None] ^ prints[others][None, :]
+        parts = xor[..., None].view(np.uint16)
+        distance = (
+            POPCOUNT[parts[..., 0]]
+            + POPCOUNT[parts[..., 1]]
+            + POPCOUNT[parts[..., 2]]
+            + POPCOUNT[parts[..., 3]]
+        )
+        close = (distance <= MAX_DISTANCE) & (
+            np.abs(durations[rows][:, None] - durations[others][None, :])
+            <= MAX_DURATION_DIFFERENCE
+        )
+        for first, second in zip(*np.nonzero(np.triu(close, 1))):
+            yield rows[first], others[second]
+
+
+def find_duplicates(songs):
+    """
+    Group copies of the same song.
+    Songs are (path, file hash, duration, fingerprint) tuples, where the
+    fingerprint can be None. Files with equal hashes are copies anyway.
+    Returns lists of paths, each list holding copies in the given order.
+    """
+    parents = list(range(len(songs)))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    def union(first, second):
+        first, second = find(first), find(second)
+        if first != second:
+            parents[max(first, second)] = min(first, second)
+
+    hashes = {}
+    for index, (_, song_hash, _, _) in enumerate(songs):
+        union(hashes.setdefault(song_hash, index), index)
+    # Fingerprints differing in at most MAX_DISTANCE bits share at least
+    # one of KEY_BANDS bands, so only songs in the same bucket of a band
+    # and its value need to be compared:
+    indices = np.array(
+        [index for index, song in enumerate(songs) if song[3] is not None],
+        dtype=np.int64,
+    )
+    if len(indices) > 1:
+        prints = np.array([songs[index][3] for index in indices], dtype=np.int64)
+        durations = np.array(
+            [songs[index][2] or 0.0 for index in indices], dtype=np.float64
+        )
+        for keys in _band_keys(prints):
+            order = np.argsort(keys, kind="stable")
+            starts = np.flatnonzero(np.diff(keys[order].astype(np.int64), prepend=-1))
+            for bucket in np.split(order, starts[1:]):
+                if len(bucket) < 2:
+                    continue
+                for first, second in _close_pairs(prints, durations, bucket):
+                    union(indices[first], indices[second])
+    groups = {}
+    for index, song in enumerate(songs):
+        groups.setdefault(find(index), []).append(song[0])
+    return [group for group in groups.values() if len(group) > 1]
+
+
+class DuplicateFinder:
+    """
+    Keeps fingerprints of songs in the library index, keyed by file hash.
+    Songs without one are analyzed in a process pool, started from a
+    background thread, so the game never waits for the analysis.
+    """
+
+    def __init__(self, library, workers=None):
+        self.library = library
+        self.library.create_tables(SCHEMA)
+        self.workers = workers
+        self._thread = None
+        self._stopped = threading.Event()
+        # Songs found to be copies after the game started
+        self.duplicates = frozenset()
+
+    def describe(self, songs):
+        """(path, file hash, duration, fingerprint) of indexed songs, in order."""
+        rows = self.library.execute(
+            "SELECT songs.path, songs.hash, songs.duration, fingerprints.fingerprint "
+            "FROM songs LEFT JOIN fingerprints ON songs.hash = fingerprints.hash"
+        )
+        wanted = set(songs)
+        # Keep the order of given songs, the first copy is the one kept
+        known = {row[0]: row for row in rows if row[0] in wanted}
+        return [known[song] for song in songs if song in known]
+
+    def missing(self, songs):
+        """Hashes and paths of songs which were never fingerprinted."""
+        analyzed = {
+            song_hash
+            for song_hash, in self.library.execute("SELECT hash FROM fingerprints")
+        }
+        missing = {}
+        for song, song_hash, _, _ in self.describe(songs):
+            if song_hash not in analyzed:
+                missing.setdefault(song_hash, song)
+        return missing
+
+    def copies(self, songs):
+        """All but the first file of each song, based on known fingerprints."""
+        copies = set()
+        for group in find_duplicates(self.describe(songs)):
+            logger.sound("Same song in files: %s", ", ".join(group))
+            copies.update(group[1:])
+        return copies
+
+    def deduplicate(self, songs):
+        copies = self.copies(songs)
+        return [song for song in songs if song not in copies]
+
+    def analyze(self, songs):
+        missing = self.missing(songs)
+        if not missing:
+            return
+        logger.sound("Fingerprinting %d songs...", len(missing))
+        paths = [os.path.join(self.library.path, song) for song in missing.values()]
+        # Spawn workers, forking a process with pygame and threads is unsafe
+        with ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results = executor.map(_analyze, paths, chunksize=CHUNK_SIZE)
+            rows = []
+            for (song_hash, song), (fingerprint, error) in zip(
+                missing.items(), results
+            ):
+                if self._stopped.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+                if error is not None:
+                    logger.warning("Cannot fingerprint '%s': %s", song, error)
+                rows += [(song_hash, fingerprint)]
+                if len(rows) >= 100:
+                    self._store(rows)
+                    rows = []
+            self._store(rows)
+        logger.sound("Fingerprinting finished.")
+
+    def _store(self, rows):
+        self.library.executemany(
+            "INSERT OR REPLACE INTO fingerprints VALUES (?, ?)", rows
+        )
+
+    def _analyze_in_background(self, songs):
+        self.analyze(songs)
+        if self._stopped.is_set():
+            return
+        self.duplicates = frozenset(self.copies(songs))
+
+    def analyze_in_background(self, songs):
+        self._thread = threading.Thread(
+            target=self._analyze_in_background,
+            args=(list(songs),),
+            name="pytune-fingerprint",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path", help="folder with songs")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    setup_logging()
+
+    library = SongLibrary(args.path)
+    library.refresh()
+    finder = DuplicateFinder(library, workers=args.workers)
+    songs = library.songs()
+    finder.analyze(songs)
+    groups = find_duplicates(finder.describe(songs))
+    for group in groups:
+        print(" = ".join(group))
+    print(f"{len(groups)} songs with copies among {len(songs)} files.")
+    library.close()
+
+
+if __name__ == "__main__":
+    main()
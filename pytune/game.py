@@ -1,65 +1,236 @@
 import os
 import time
-from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
 import pygame
 
+from .engine import BUZZ_GRACE, Effect, Engine, GameState, Input
 from .graphics import ColorModes
+from .journal import GameRecord, Journal
+from .leaderboard import Leaderboard, RoundClock
 from .logger import init_logger
-from .player import Host, Player
-from .sound import Sound
-
+from .metrics import Metrics
+from .playback import BACKENDS
+from .profiling import Profiler
+from .player import Host, HostState, Player, PlayerRegistry, PlayerState
+from .remote import PLAYER_JOINED, BuzzerServer, RemoteJoystick
+from .scheduler import FrameScheduler
+from .sound import Sound, SoundEffects
+from .visualizer import Visualizer
 
 logger = init_logger(__name__)
 
 
-class GameState(Enum):
-    ERROR = -1
-    QUIT = 0
-    IDLE = 1
-    INTRO = 2
-    MUSIC_ROUND = 3
-    RANKING_ROUND = 4
-    HOST_ROUND = 5
-    PLAYER_ROUND = 6
+# Actions setting states shown on cards:
+PLAYER_ACTIONS = {
+    PlayerState.ACTIVE: Player.set_active,
+    PlayerState.ANSWERING: Player.set_answering,
+    PlayerState.ELIMINATED: Player.set_eliminated,
+    PlayerState.WIN: Player.set_win,
+}
+HOST_ACTIONS = {
+    HostState.ACTIVE: Host.set_active,
+    HostState.RANKING: Host.set_ranking,
+}
+
+# Host keys and inputs of the engine they make:
+HOST_KEYS = {
+    pygame.K_SPACE: Input.SPACE,
+    pygame.K_c: Input.CONTINUE,
+    pygame.K_s: Input.PAUSE,
+    pygame.K_0: Input.MINUS,
+    pygame.K_1: Input.PLUS,
+}
 
 
-class Actors(Enum):
-    HOST = -1
+def start_intro_music():
+    # Intro music queue:
+    pygame.mixer.music.load(os.path.join("./assets", "intro_start.wav"))
+    pygame.mixer.music.play()
+    pygame.mixer.music.queue(os.path.join("./assets", "intro_middle.wav"), loops=-1)
 
 
 class Game:
-    def __init__(self, path, random_order):
-        self.players = self._init_players()
-        self.disabled_players = []  # Disabled joysticks
-        self.current_state = GameState.IDLE
-        self.who_stopped = Actors.HOST
-        self.sound = Sound(path, random_order)
-        self.round_counter = 0
-
-    def _init_players(self):
-        # Initialize joystick(s) and Players
-        players = []
-        number_of_joysticks = pygame.joystick.get_count()
-        if number_of_joysticks > 0:
-            for joystick_id in range(0, number_of_joysticks):
+    def __init__(
+        self,
+        path,
+        random_order,
+        backend="mixer",
+        random_offset=False,
+        journal_path=None,
+        resume=False,
+        joysticks=None,
+        metrics_path=None,
+        remote_port=None,
+        buzz_grace=BUZZ_GRACE,
+        sfx=True,
+        leaderboard_path=None,
+        season=None,
+        profile=False,
+        profile_frames=600,
+        profile_rounds=None,
+        vsync=False,
+        normalize=True,
+        analyze=True,
+    ):
+        self.players = self._init_players(joysticks, remote=remote_port is not None)
+        # Rules of the game, this class only applies their effects:
+        self.engine = Engine(len(self.players), buzz_grace=buzz_grace)
+        # Song library loads in the background while joysticks and
+        # the board get ready, the first use of `sound` waits for it.
+        # A missing folder is still reported right away:
+        if not os.path.isdir(path):
+            raise OSError(f"Folder '{path}' does not exist!")
+        loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pytune-load")
+        self._sound_loading = loader.submit(
+            Sound,
+            path,
+            random_order,
+            backend=BACKENDS[backend](),
+            random_offset=random_offset,
+            normalize=normalize,
+            analyze=analyze,
+        )
+        loader.shutdown(wait=False)
+        self._sound = None
+        # Buzzes and stings are ready before anyone presses anything:
+        self.sfx = None
+        if sfx and pygame.mixer.get_init():
+            self.sfx = SoundEffects(len(self.players))
+        self.scheduler = FrameScheduler(vsync=vsync)
+        # Spectrum of the playing song on the host card:
+        self.visualizer = Visualizer()
+        # Latency and frame time samples, exported on exit:
+        self.metrics = Metrics()
+        self.metrics_path = metrics_path
+        # Call and allocation profiles of a window of frames, F9 starts one:
+        self.profiler = Profiler(frames=profile_frames, rounds=profile_rounds)
+        if profile:
+            self.profiler.start()
+        self._highlight_pending = None  # Timestamp of a buzz not shown yet
+        # A resumed game stays the same game in the league:
+        league_game = None
+        if resume and journal_path and os.path.exists(journal_path):
+            league_game = GameRecord.replay(journal_path).league_game
+        # Keep results safe on disk:
+        self.journal = Journal(journal_path, resume) if journal_path else None
+        # League results, stored at the end of every round:
+        self.leaderboard = None
+        if leaderboard_path is not None:
+            self.leaderboard = Leaderboard(
+                leaderboard_path,
+                season,
+                [self.player_name(player) for player in self.players],
+                game=league_game,
+            )
+            self._record("league", self.leaderboard.game)
+        self._round_clock = RoundClock()
+        self._reactions = {}  # Reaction times of buzzes, by player number
+        self._round_results = []
+        # Players on the local network:
+        self.remote = None
+        if remote_port is not None:
+            self.remote = BuzzerServer(port=remote_port)
+            self.remote.start()
+
+    @property
+    def sound(self):
+        if self._sound is None:
+            self._sound = self._sound_loading.result()
+        return self._sound
+
+    @property
+    def current_state(self):
+        return self.engine.state
+
+    @current_state.setter
+    def current_state(self, state):
+        self.engine.state = state
+
+    @property
+    def who_stopped(self):
+        return self.engine.who_stopped
+
+    @property
+    def stopped_at(self):
+        return self.engine.stopped_at
+
+    @property
+    def disabled_players(self):
+        return self.engine.disabled_players
+
+    @property
+    def round_counter(self):
+        return self.engine.round_counter
+
+    def _init_players(self, joysticks=None, remote=False):
+        # Initialize joystick(s) and Players.
+        # Joystick-like devices can be passed instead, e.g. for simulations.
+        # With remote players on the way, the game can start without any.
+        players = PlayerRegistry()
+        if joysticks is None:
+            joysticks = [
+                pygame.joystick.Joystick(joystick_id)
+                for joystick_id in range(0, pygame.joystick.get_count())
+            ]
+        if len(joysticks) > 0 or remote:
+            for joystick in joysticks:
                 # Create a player
-                players.append(
-                    Player(joystick_id, pygame.joystick.Joystick(joystick_id))
-                )
-                players[joystick_id].joystick.init()
-                logger.debug(f"DEBUG: {players[joystick_id].number}")
-                logger.debug(f"DEBUG: {players[joystick_id].joystick}")
-                logger.debug(f"DEBUG: {players[joystick_id].joystick.get_init()}")
-                logger.debug(f"DEBUG: {players[joystick_id].joystick.get_name()}")
+                player = players.add(joystick)
+                player.joystick.init()
+                logger.debug("DEBUG: %s", player.number)
+                logger.debug("DEBUG: %s", player.joystick)
+                logger.debug("DEBUG: %s", player.joystick.get_init())
+                logger.debug("DEBUG: %s", player.joystick.get_name())
         else:
             raise RuntimeError("No joysticks detected!")
         return players
 
+    @staticmethod
+    def player_name(player):
+        # Names of remote players are their own, others are numbered
+        if isinstance(player.joystick, RemoteJoystick):
+            return player.joystick.get_name()
+        return f"Player {player.number}"
+
+    def _end_round(self):
+        # Results are handed over in one piece, off the game loop
+        if self.leaderboard is not None:
+            self.leaderboard.record_round(self._round_results)
+        self._round_results = []
+        self._reactions = {}
+
+    def _record(self, kind, *args):
+        if self.journal is not None:
+            self.journal.record(kind, *args)
+
+    def restore(self, board):
+        """Continue the last game recorded in the journal."""
+        record = GameRecord.replay(self.journal.path)
+        for player in self.players:
+            player.points = record.points.get(player.number, 0)
+        self.engine.restore(record.points, record.round_counter)
+        self.sound.skip_songs(record.songs)
+        self.activate_board(board)
+        logger.game("Game restored after round %s.", self.round_counter)
+
     # TODO: to return somehow to main function and exit properly?
     # For example break from game loops and check if current state is QUIT?
     def quit(self):
         self.current_state = GameState.QUIT
         self.sound.pause_current_song()
+        self.visualizer.stop()
+        self.sound.close()
+        if self.remote is not None:
+            self.remote.close()
+        self._record("quit")
+        if self.journal is not None:
+            self.journal.close()
+        self._end_round()
+        if self.leaderboard is not None:
+            self.leaderboard.close()
+        if self.metrics_path is not None:
+            self.metrics.export(self.metrics_path)
+        self.profiler.stop()
         logger.game("Game exited.")
         pygame.quit()
         exit()
@@ -68,18 +239,78 @@ class Game:
         if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
             self.quit()
 
+    def check_remote(self, event, board):
+        # Remote player said hello for the first time:
+        if event.type == PLAYER_JOINED:
+            player = self.players.add(event.joystick)
+            self.engine.add_player()
+            if self.sfx is not None:
+                self.sfx.preload(len(self.players))
+            board.add_player(player, name=event.joystick.get_name())
+            if self.leaderboard is not None:
+                self.leaderboard.join([self.player_name(player)])
+            # Players waiting for the introduction stay idle:
+            if self.current_state != GameState.INTRO:
+                player.set_active()
+            logger.game(
+                "Remote player '%s' joined as Player #%s",
+                event.joystick.get_name(),
+                player.number,
+            )
+
+    def check_overlay(self, event):
+        # F3 shows or hides the debug overlay:
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            self.metrics.toggle_overlay()
+
+    def check_profiler(self, event):
+        # F9 starts a profile, or ends the running one early:
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F9:
+            self.profiler.toggle()
+
+    def draw(self, board):
+        board.host_card.overlay = self.metrics.overlay_lines()
+        board.host_card.visualizer = self.visualizer
+        # Buzz waiting in the queue is handled first, the spectrum can wait:
+        if not pygame.event.peek(pygame.JOYBUTTONDOWN):
+            self.visualizer.update()
+        start = time.perf_counter()
+        dirty_rects = board.draw(round_counter=self.round_counter)
+        end = time.perf_counter()
+        self.metrics.add("draw_time", end - start)
+        if self.visualizer.running:
+            self.metrics.add("visualizer_time", self.visualizer.spent)
+        # Buzz is visible once the frame with the highlight is drawn:
+        if self._highlight_pending is not None:
+            self.metrics.add("buzz_to_highlight", end - self._highlight_pending)
+            self._highlight_pending = None
+        self.scheduler.frame_done(dirty_rects, animating=self.visualizer.running)
+        if self.profiler.active:
+            self.profiler.frame_done()
+
+    def check_expose(self, event, board):
+        # Window content was lost (e.g. uncovered or restored), repaint all:
+        if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            board.invalidate()
+        # New window size needs a new layout:
+        elif event.type in (pygame.VIDEORESIZE, pygame.WINDOWSIZECHANGED):
+            board.resize()
+        # F11 switches between fullscreen and window:
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_F11:
+            pygame.display.toggle_fullscreen()
+            board.resize()
+
     def show_intro(self, board):
-        # Intro music queue:
-        pygame.mixer.music.load(os.path.join("./assets", "intro_start.wav"))
-        pygame.mixer.music.play()
-        pygame.mixer.music.queue(os.path.join("./assets", "intro_middle.wav"), loops=-1)
+        # Intro music is usually started first thing on launch:
+        if not pygame.mixer.music.get_busy():
+            start_intro_music()
         # Welcome as Host:
-        logger.host(f"Press 'H' as HOST to say hi...")
-        logger.host(f"Press spacebar as HOST to introduce next player...")
+        logger.host("Press 'H' as HOST to say hi...")
+        logger.host("Press spacebar as HOST to introduce next player...")
         self.current_state = GameState.INTRO
         board.host_card.player.set_intro()
         while self.current_state == GameState.INTRO:
-            for event in pygame.event.get():
+            for event in self.scheduler.wait_events():
                 # Host actions:
                 if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
                     self.current_state = GameState.IDLE
@@ -88,19 +319,21 @@ class Game:
                     board.host_card.switch_color()  # Switch colors on action.
                 # Check for 'Esc' key press to quit the game
                 self.check_quit(event)
+                self.check_expose(event, board)
+                self.check_remote(event, board)
+                self.check_overlay(event)
+                self.check_profiler(event)
             # Update the graphics
-            board.draw()
+            self.draw(board)
         # Set Host to active state and indicate that input is needed:
         board.host_card.highlight(active=True, action=Host.set_active)
         # Begin player introductions:
         for player in self.players:
-            logger.game(f"Welcome Player #{player.number}")
-            logger.debug(f"DEBUG: {player.joystick}")
+            logger.game("Welcome Player #%s", player.number)
+            logger.debug("DEBUG: %s", player.joystick)
             # Shake the joystick:
             player.joystick.rumble(low_frequency=0.5, high_frequency=1.0, duration=2)
-            logger.host(
-                f"Press spacebar as HOST to introduce next player..."
-            )
+            logger.host("Press spacebar as HOST to introduce next player...")
             # Set game state:
             self.current_state = GameState.INTRO
             # Get player card:
@@ -108,7 +341,7 @@ class Game:
             card.player.set_intro()
             # Start intro:
             while self.current_state == GameState.INTRO:
-                for event in pygame.event.get():
+                for event in self.scheduler.wait_events():
                     # Host actions:
                     if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
                         player.joystick.rumble(
@@ -124,188 +357,168 @@ class Game:
                         self.host_pause_song(board)
                     # Player can check the device - "say hi"
                     if event.type == pygame.JOYBUTTONDOWN:
-                        if event.instance_id == player.number:
+                        if self.players.get(event.instance_id) is player:
                             card.switch_color()  # Switch colors on action.
+                            if self.sfx is not None:
+                                self.sfx.buzz(player.number)
                     # Check for 'Esc' key press to quit the game
                     self.check_quit(event)
+                    self.check_expose(event, board)
+                    self.check_remote(event, board)
+                    self.check_overlay(event)
+                    self.check_profiler(event)
                 # Update the graphics
-                board.draw()
+                self.draw(board)
             # Restore cards and players to original state:
             card.highlight(active=False, action=Player.set_idle)
         # Ends music with fade out effect
         pygame.mixer.music.fadeout(5000)  # time in ms, TODO: parametrize
-        # Set Host to active state:
-        board.host_card.player.set_active()
-        # Set all player to ACTIVE to show message:
-        for card in board.player_cards:
-            card.player.set_active()
+        self.activate_board(board)
         # Shake all joysticks:
         for player in self.players:
             player.joystick.rumble(low_frequency=0.5, high_frequency=1.0, duration=2)
         # Set game state to IDLE to show message:
         self.current_state = GameState.IDLE
 
-    def listen_to_players(self, event, board):
-        # Players are only active during MUSIC_ROUND
-        if self.current_state == GameState.MUSIC_ROUND:
-            if event.type == pygame.JOYBUTTONDOWN:
-                if event.instance_id not in self.disabled_players:
-                    self.sound.pause_current_song()
-                    self.who_stopped = event.instance_id
-                    self.current_state = GameState.RANKING_ROUND
-                    # Get card and update it to highlight:
-                    board.get_player_card(self.who_stopped).highlight(
-                        active=True, action=Host.set_answering
+    def activate_board(self, board):
+        # Set Host to active state:
+        board.host_card.player.set_active()
+        # Set all player to ACTIVE to show message:
+        for card in board.player_cards:
+            card.player.set_active()
+
+    def apply(self, effects, board):
+        """Apply effects of an engine input to the sound, board and journal."""
+        for effect, *args in effects:
+            match effect:
+                case Effect.PAUSE_SONG:
+                    if self.sound.pause_current_song() == 1:
+                        self.quit()
+                    self.visualizer.pause()
+                    self._round_clock.pause(time.perf_counter())
+                case Effect.CONTINUE_SONG:
+                    if self.sound.continue_current_song() == 1:
+                        self.quit()
+                    self.visualizer.resume()
+                    self._round_clock.resume(time.perf_counter())
+                case Effect.PLAY_NEXT:
+                    # If sound code equals to 1, there is no more songs,
+                    # the game ends here.
+                    self._end_round()
+                    if self.profiler.active:
+                        self.profiler.round_started()
+                    if self.sound.play_next_song() == 1:
+                        self.quit()
+                    self._round_clock.start(time.perf_counter())
+                    self.visualizer.start(*self.sound.current_audio)
+                    board.host_card.track = self.sound.current_track
+                    self._record("next", self.sound.current_song)
+                    logger.sound("Song started!")
+                    logger.game("Players, press anything to stop the song!")
+                case Effect.HIGHLIGHT_HOST:
+                    active, state = args
+                    board.host_card.highlight(active, action=HOST_ACTIONS[state])
+                case Effect.HIGHLIGHT_PLAYER:
+                    number, active, state = args
+                    board.get_player_card(number).highlight(
+                        active, action=PLAYER_ACTIONS[state]
                     )
-                    # Set Host to ranking state and indicate that input is needed:
-                    board.host_card.highlight(active=True, action=Host.set_ranking)
-                    logger.player(f"Song stopped by the Player #{self.who_stopped}!")
-                    logger.host(f"Give points to the Player #{self.who_stopped}...")
+                case Effect.RESET_PLAYERS:
+                    for card in board.player_cards:
+                        card.highlight(active=False, action=Player.set_active)
+                case Effect.BUZZED:
+                    number, takeover = args
+                    timestamp = self.engine.stopped_at
+                    if self.sfx is not None:
+                        self.sfx.buzz(number)
+                    if not takeover:
+                        self.metrics.add(
+                            "buzz_to_pause", time.perf_counter() - timestamp
+                        )
+                    self._highlight_pending = timestamp
+                    self._reactions[number] = self._round_clock.played(timestamp)
+                    self._record("buzz", number)
+                    logger.player("Song stopped by the Player #%s!", number)
+                    if takeover:
+                        logger.host("Give points to the Player #%s instead...", number)
+                    else:
+                        logger.host("Give points to the Player #%s...", number)
+                case Effect.SCORED:
+                    number, delta = args
+                    self.players[number].points += delta
+                    self._round_results += [
+                        (
+                            self.round_counter,
+                            self.player_name(self.players[number]),
+                            delta,
+                            self._reactions.get(number),
+                            self.sound.current_song,
+                        )
+                    ]
+                    if delta > 0:
+                        self._record("plus", number)
+                        if self.sfx is not None:
+                            self.sfx.right()
+                        logger.game("Points awarded to the Player #%s!", number)
+                    else:
+                        self._record("minus", number)
+                        if self.sfx is not None:
+                            self.sfx.wrong()
+                        logger.game("Penalty points to the Player #%s!", number)
+                    logger.host("Now HOST is in control!")
+                case Effect.SKIPPED:
+                    self._record("skip")
+                    logger.host(
+                        "Song skipped by the HOST! Play next song by pressing space!"
+                    )
+
+    def listen_to_players(self, event, board):
+        if event.type == pygame.JOYBUTTONDOWN:
+            player = self.players.get(event.instance_id)
+            # Ignore unknown devices:
+            if player is not None:
+                effects = self.engine.handle(
+                    Input.BUZZ, player.number, event.timestamp, time.perf_counter()
+                )
+                self.apply(effects, board)
 
     def host_continue_song(self, board):
-        # Set Host to active state and remove highlight.
-        # This indicates that host started the music again.
-        board.host_card.highlight(active=False, action=Host.set_active)
-        if self.sound.continue_current_song() == 1:
-            self.quit()
+        # Remove the highlight of the host, music plays again
+        self.apply(self.engine.handle(Input.CONTINUE), board)
 
     def host_pause_song(self, board):
-        # Set Host to active state and keep highlighted.
-        # This indicates that host needs to either skip
-        # the round or resume music.
-        board.host_card.highlight(active=True, action=Host.set_active)
-        if self.sound.pause_current_song() == 1:
-            self.quit()
-
-    def host_next_song(self, board):
-        # Set Host to active state and remove the highlight:
-        board.host_card.highlight(active=False, action=Host.set_active)
-        # Restore all players and cards:
-        for card in board.player_cards:
-            card.highlight(active=False, action=Player.set_active)
-        # Play next song and check returned code.
-        # If sound code equals to 1, there is no more songs,
-        # the game ends here.
-        if self.sound.play_next_song() == 1:
-            self.quit()
-        # Clear disabled players list:
-        self.disabled_players = []
-        self.current_state = GameState.MUSIC_ROUND
-        # Add next round:
-        self.round_counter += 1
-        logger.sound("Song started!")
-        logger.game("Players, press anything to stop the song!")
-
-    def host_skip_song(self, board):
-        # Set Host to active state and keep highlighted.
-        # This indicates that host needs to play next song.
-        board.host_card.highlight(active=True, action=Host.set_active)
-        # Restore all players and cards:
-        for card in board.player_cards:
-            card.highlight(active=False, action=Player.set_active)
-        # Skip the song:
-        self.sound.pause_current_song()
-        self.who_stopped = Actors.HOST
-        self.current_state = GameState.IDLE
-        logger.host(f"Song skipped by the HOST! Play next song by pressing space!")
-
-    def host_give_minus(self, board):
-        for player in self.players:
-            if self.who_stopped == player.number:
-                player.points -= 1
-                # Get card and update it to eliminated:
-                board.get_player_card(self.who_stopped).highlight(
-                    active=False, action=Player.set_eliminated
-                )
-                # Set Host to active state and keep highlighted.
-                # This indicates that host needs to either skip
-                # the round or play again.
-                board.host_card.highlight(active=True, action=Host.set_active)
-                logger.game(f"Penalty points to the Player #{self.who_stopped}!")
-        # Put the player on disabled players list:
-        self.disabled_players += [self.who_stopped]
-        # Change the who_stopped to HOST:
-        self.who_stopped = Actors.HOST
-        # Continue music round:
-        # TODO: should music start automatically?
-        self.current_state = GameState.MUSIC_ROUND  # GameState.IDLE
-        logger.host(f"Now HOST is in control!")
-
-    def host_give_plus(self, board):
-        for player in self.players:
-            if self.who_stopped == player.number:
-                player.points += 1
-                # Get card and update it to highlight:
-                board.get_player_card(self.who_stopped).highlight(
-                    active=True, action=Player.set_win
-                )
-                # Set Host to active state and keep highlighted.
-                # This indicates that host needs to skip or
-                # play the song for the rest to check.
-                board.host_card.highlight(active=True, action=Host.set_active)
-                logger.game(f"Points awarded to the Player #{self.who_stopped}!")
-        self.who_stopped = Actors.HOST
-        self.current_state = GameState.IDLE
-        logger.host(f"Now HOST is in control!")
+        # Keep the host highlighted, the round needs to be
+        # either skipped or continued
+        self.apply(self.engine.handle(Input.PAUSE), board)
 
     def listen_to_host(self, event, board):
-        # Start the music
-        if self.current_state == GameState.IDLE:
-            # Start next song:
-            if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
-                self.host_next_song(board)
-            # Continue song:
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_c:
-                self.host_continue_song(board)
-            # Stop song:
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_s:
-                self.host_pause_song(board)
-        # Stop the music
-        elif self.current_state == GameState.MUSIC_ROUND:
-            if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
-                self.host_skip_song(board)
-            # Continue song:
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_c:
-                self.host_continue_song(board)
-            # Stop song:
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_s:
-                self.host_pause_song(board)
-        elif self.current_state == GameState.RANKING_ROUND:
-            # Give points to the player who stopped.
-            # If player who stopped is the HOST, this is disabled.
-            if self.who_stopped != Actors.HOST:
-                # Check for "0" key press (-1 points)
-                if event.type == pygame.KEYDOWN and event.key == pygame.K_0:
-                    self.host_give_minus(board)
-                # Check for "1" key press (1 point)
-                elif event.type == pygame.KEYDOWN and event.key == pygame.K_1:
-                    self.host_give_plus(board)
+        if event.type == pygame.KEYDOWN and event.key in HOST_KEYS:
+            self.apply(self.engine.handle(HOST_KEYS[event.key]), board)
+
+    def step(self, board):
+        # Sleep until something happens or the next frame is due.
+        # Events are handled in the order they were pressed, so
+        # the earliest press wins the round even if several
+        # players buzzed in between two wake-ups.
+        events = self.scheduler.wait_events()
+        self.metrics.add("queue_depth", len(events))
+        for event in events:
+            # Listen to player inputs
+            self.listen_to_players(event, board)
+            # Listen to host inputs
+            self.listen_to_host(event, board)
+            # Game Quit, can exit at any point
+            # Check for 'Esc' key press to quit the game
+            self.check_quit(event)
+            self.check_expose(event, board)
+            self.check_remote(event, board)
+            self.check_overlay(event)
+            self.check_profiler(event)
+        # Update the graphics
+        self.draw(board)
 
     def start_game(self, board):
         logger.host("Press '0' for no points, '1' for points, and 'Esc' to quit.")
         logger.host("Press spacebar to start the song.")
         while True:
-            # Music Round -- Player/Host
-            for event in pygame.event.get():
-                # Listen to player inputs
-                self.listen_to_players(event, board)
-                # Listen to host inputs
-                self.listen_to_host(event, board)
-                # Game Quit, can exit at any point
-                # Check for 'Esc' key press to quit the game
-                self.check_quit(event)
-                # If is changing the GameState
-                # exit this loop and go into another one
-                if self.current_state == GameState.IDLE:
-                    break
-
-            # Ranking Round -- Host Round
-            for event in pygame.event.get():
-                self.listen_to_host(event, board)
-                self.check_quit(event)
-                if self.current_state != GameState.IDLE:
-                    break
-
-            # Update the graphics
-            board.draw(round_counter=self.round_counter)
-            time.sleep(0.1)
+            self.step(board)
@@ -1,18 +1,24 @@
+import colorsys
+import functools
+import math
+from collections import OrderedDict, namedtuple
 from enum import Enum
 
 import pygame
 
+from .metadata import format_duration
 from .player import Host, HostState, Player, PlayerState
 
 # Window dimensions
 WINDOW_WIDTH = 1200
 WINDOW_HEIGHT = 500
 
-# Number of rectangles
+# Minimal number of cards on the board, unused places show inactive cards
 NUM_RECTANGLES = 5
 
-# Calculate the height of each rectangle
+# Size of a card at full scale, smaller cards scale fonts down
 RECTANGLE_WIDTH = WINDOW_WIDTH // NUM_RECTANGLES
+RECTANGLE_HEIGHT = WINDOW_HEIGHT
 
 
 class Colors(Enum):
@@ -58,11 +64,74 @@ CARD_PALETTE = {
     },
 }
 
-# Font setup
-pygame.font.init()  # Initialize the font module even if game is not initialized itself
-font_big = pygame.font.Font(None, 36)
-font_medium = pygame.font.Font(None, 24)
-font_small = pygame.font.Font(None, 16)
+# Classic colors of the first players, the following ones get generated
+PLAYER_COLORS = [Colors.PURPLE, Colors.ORANGE, Colors.GREEN, Colors.BLUE]
+# Step between hues of generated colors, spreads them evenly for any count
+GOLDEN_RATIO_CONJUGATE = 0.618033988749895
+
+
+@functools.lru_cache(maxsize=None)
+def player_palette(number):
+    if number < len(PLAYER_COLORS):
+        return CARD_PALETTE[PLAYER_COLORS[number]]
+    hue = (number * GOLDEN_RATIO_CONJUGATE) % 1.0
+    return {
+        ColorModes.DARK: _hsv_to_rgb(hue, 0.75, 1.0),
+        ColorModes.LIGHT: _hsv_to_rgb(hue, 0.3, 1.0),
+        ColorModes.INACTIVE: (230, 230, 230),
+    }
+
+
+def _hsv_to_rgb(hue, saturation, value):
+    return tuple(
+        round(channel * 255)
+        for channel in colorsys.hsv_to_rgb(hue, saturation, value)
+    )
+
+
+# Font sizes at full scale
+FONT_SIZES = (36, 24, 16)
+
+Fonts = namedtuple("Fonts", ["big", "medium", "small"])
+
+
+@functools.lru_cache(maxsize=8)
+def scaled_fonts(scale):
+    # Fonts are created on first use, so importing pytune stays cheap
+    if not pygame.font.get_init():
+        pygame.font.init()
+    return Fonts(
+        *[pygame.font.Font(None, max(int(size * scale), 12)) for size in FONT_SIZES]
+    )
+
+
+def grid_layout(width, height, count):
+    """
+    Splits the window into a grid of count cards.
+    Returns rectangles of cards in rows from the top left and the scale
+    of cards, choosing the number of rows that keeps cards the largest.
+    """
+    best_rows, best_scale = 1, 0.0
+    for rows in range(1, count + 1):
+        columns = math.ceil(count / rows)
+        scale = min(
+            width / columns / RECTANGLE_WIDTH, height / rows / RECTANGLE_HEIGHT
+        )
+        if scale > best_scale:
+            best_rows, best_scale = rows, scale
+    columns = math.ceil(count / best_rows)
+    card_width, card_height = width // columns, height // best_rows
+    rects = [
+        pygame.Rect(
+            (index % columns) * card_width,
+            (index // columns) * card_height,
+            card_width,
+            card_height,
+        )
+        for index in range(count)
+    ]
+    # Round the scale down to a few steps, so few font sizes get created
+    return rects, max(math.floor(best_scale * 20) / 20, 0.05)
 
 
 FONT_PALETTE = {
@@ -74,55 +143,141 @@ FONT_PALETTE = {
 }
 
 
+class TextCache:
+    """
+    Bounded LRU cache of rendered text surfaces.
+    Cards keep drawing the same few strings, so rendering
+    each (font, text, color) combination once is enough.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._surfaces = OrderedDict()
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self._surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = font.render(text, True, color)
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.maxsize:
+            self._surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self._surfaces.clear()
+
+
+text_cache = TextCache()
+
+
 class BoardCard:
-    def __init__(self, index, color, name="Inactive", device="-", player=None):
-        self.index = index
-        self.color = color
+    def __init__(self, index, palette, name="Inactive", device="-", player=None):
+        self.index = index  # Place of the card on the board
+        self.palette = palette
         self.name = name
         self.device = device
         self.mode = ColorModes.INACTIVE
         # Set stub player in place for every card
         self.player = Player() if player is None else player
-
-    def _draw_background(self, window):
-        pygame.draw.rect(
-            window,
-            CARD_PALETTE[self.color][self.mode],
-            (self.index * RECTANGLE_WIDTH, 0, RECTANGLE_WIDTH, WINDOW_HEIGHT),
+        # Area and fonts of the card, set by the board layout
+        self.rect = pygame.Rect(
+            index * RECTANGLE_WIDTH, 0, RECTANGLE_WIDTH, RECTANGLE_HEIGHT
         )
-
-    def _draw_name(self, window):
+        self.fonts = None
+        # State of the card at the time it was last drawn
+        self._drawn_state = None
+        # Pre-rendered parts of the card, one per card mode at most
+        self._layers = {}
+
+    def place(self, rect, fonts):
+        self.rect = rect
+        self.fonts = fonts
+        self._layers.clear()
+        self.invalidate()
+
+    def _state(self):
+        # Everything that changes how the card looks
+        return (self.mode, self.name, self.device)
+
+    def _static_state(self):
+        # Everything that changes the pre-rendered layer
+        return (self.mode, self.name, self.device)
+
+    def _draw_static(self, surface, rect):
+        self._draw_background(surface, rect)
+        self._draw_name(surface, rect)
+        self._draw_device(surface, rect)
+
+    def _draw_layer(self, window):
+        state = self._static_state()
+        layer = self._layers.get(state)
+        if layer is None:
+            if len(self._layers) >= len(ColorModes):
+                self._layers.clear()
+            layer = pygame.Surface(self.rect.size).convert()
+            self._draw_static(layer, layer.get_rect())
+            self._layers[state] = layer
+        window.blit(layer, self.rect)
+
+    def invalidate(self):
+        """Force the card to be drawn again on the next redraw."""
+        self._drawn_state = None
+
+    def redraw(self, window, **kwargs):
+        """
+        Draw the card only if it changed since the last time it was drawn.
+        Returns the rectangle that needs a display update or None.
+        """
+        state = self._state(**kwargs)
+        if state == self._drawn_state:
+            return None
+        # Long texts of small cards must not spill over their neighbours
+        window.set_clip(self.rect)
+        self.draw(window, **kwargs)
+        window.set_clip(None)
+        self._drawn_state = state
+        return self.rect
+
+    def _draw_background(self, surface, rect):
+        pygame.draw.rect(surface, self.palette[self.mode], rect)
+
+    def _draw_name(self, surface, rect):
         # Get the surface and rectangle for the text
-        text_surface = font_big.render(
-            self.name, True, FONT_PALETTE[Colors.BLACK][self.mode]
+        text_surface = text_cache.render(
+            self.fonts.big, self.name, FONT_PALETTE[Colors.BLACK][self.mode]
         )
         text_rect = text_surface.get_rect(
             center=(
-                self.index * RECTANGLE_WIDTH + RECTANGLE_WIDTH // 2,
-                WINDOW_HEIGHT // 4,
+                rect.centerx,
+                rect.top + rect.height // 4,
             )
         )
-        # Blit the text onto the window
-        window.blit(text_surface, text_rect)
+        # Blit the text onto the surface
+        surface.blit(text_surface, text_rect)
 
-    def _draw_device(self, window):
+    def _draw_device(self, surface, rect):
         # Get the surface and rectangle for the text
-        text_surface = font_small.render(
-            self.device, True, FONT_PALETTE[Colors.BLACK][self.mode]
+        text_surface = text_cache.render(
+            self.fonts.small, self.device, FONT_PALETTE[Colors.BLACK][self.mode]
         )
         text_rect = text_surface.get_rect(
             center=(
-                self.index * RECTANGLE_WIDTH + RECTANGLE_WIDTH // 2,
-                WINDOW_HEIGHT // 3.3,
+                rect.centerx,
+                rect.top + rect.height // 3.3,
             )
         )
-        # Blit the text onto the window
-        window.blit(text_surface, text_rect)
+        # Blit the text onto the surface
+        surface.blit(text_surface, text_rect)
 
     def draw(self, window):
-        self._draw_background(window)
-        self._draw_name(window)
-        self._draw_device(window)
+        self._draw_layer(window)
 
     def switch_color(self):
         """Switch colors between light and dark."""
@@ -142,28 +297,35 @@ class BoardCard:
 
 
 class PlayerCard(BoardCard):
-    def __init__(self, index, color, name, device, player):
-        super().__init__(index, color, name, device, player)
+    def __init__(self, index, palette, name, device, player):
+        super().__init__(index, palette, name, device, player)
 
-    def _draw_score(self, window):
-        text_surface = font_medium.render(
-            "Score", True, FONT_PALETTE[Colors.BLACK][self.mode]
+    def _state(self):
+        return super()._state() + (self.player.player_state, self.player.points)
+
+    def _draw_static(self, surface, rect):
+        super()._draw_static(surface, rect)
+        text_surface = text_cache.render(
+            self.fonts.medium, "Score", FONT_PALETTE[Colors.BLACK][self.mode]
         )
         text_rect = text_surface.get_rect(
             center=(
-                self.index * RECTANGLE_WIDTH + RECTANGLE_WIDTH // 2,
-                WINDOW_HEIGHT // 2,
+                rect.centerx,
+                rect.top + rect.height // 2,
             )
         )
-        window.blit(text_surface, text_rect)
+        surface.blit(text_surface, text_rect)
 
-        text_surface = font_big.render(
-            str(self.player.points), True, FONT_PALETTE[Colors.BLACK][self.mode]
+    def _draw_score(self, window):
+        text_surface = text_cache.render(
+            self.fonts.big,
+            str(self.player.points),
+            FONT_PALETTE[Colors.BLACK][self.mode],
         )
         text_rect = text_surface.get_rect(
             center=(
-                self.index * RECTANGLE_WIDTH + RECTANGLE_WIDTH // 2,
-                WINDOW_HEIGHT // 1.8,
+                self.rect.centerx,
+                self.rect.top + self.rect.height // 1.8,
             )
         )
         window.blit(text_surface, text_rect)
@@ -185,13 +347,13 @@ class PlayerCard(BoardCard):
             case _:
                 raise RuntimeError("Unknown player state!")
 
-        text_surface = font_medium.render(
-            message, True, FONT_PALETTE[Colors.BLACK][self.mode]
+        text_surface = text_cache.render(
+            self.fonts.medium, message, FONT_PALETTE[Colors.BLACK][self.mode]
         )
         text_rect = text_surface.get_rect(
             center=(
-                self.index * RECTANGLE_WIDTH + RECTANGLE_WIDTH // 2,
-                WINDOW_HEIGHT // 1.2,
+                self.rect.centerx,
+                self.rect.top + self.rect.height // 1.2,
             )
         )
         window.blit(text_surface, text_rect)
@@ -203,28 +365,107 @@ class PlayerCard(BoardCard):
 
 
 class HostCard(BoardCard):
-    def __init__(self, index, color, name, device):
-        super().__init__(index, color, name, device, Host(index))
+    def __init__(self, index, palette, name, device):
+        super().__init__(index, palette, name, device, Host(index))
+        # Lines of the debug overlay, empty if hidden
+        self.overlay = ()
+        # Spectrum of the playing song, drawn apart from the rest of the card
+        self.visualizer = None
+        # Tags of the playing song (TrackInfo), shown while ranking
+        self.track = None
+
+    def _state(self, round_counter=0):
+        return super()._state() + (
+            self.player.host_state,
+            round_counter,
+            self.overlay,
+            self.track,
+        )
 
-    def _draw_round_counter(self, window, round_counter=0):
-        text_surface = font_medium.render(
-            "Round", True, FONT_PALETTE[Colors.BLACK][self.mode]
+    @property
+    def visualizer_rect(self):
+        # Strip at the bottom of the card, below the host messages
+        height = max(self.rect.height // 10, 4)
+        return pygame.Rect(
+            self.rect.left, self.rect.bottom - height, self.rect.width, height
+        )
+
+    def redraw_visualizer(self, window, force=False):
+        """Draw the spectrum strip, returns the rectangle to update or None."""
+        if self.visualizer is None:
+            return None
+        bars = ColorModes.DARK if self.mode == ColorModes.LIGHT else ColorModes.LIGHT
+        return self.visualizer.draw(
+            window,
+            self.visualizer_rect,
+            self.palette[self.mode],
+            self.palette[bars],
+            force=force,
+        )
+
+    def _fit(self, font, text):
+        # Shorten texts wider than the card, keeping some margin
+        width = self.rect.width - 8
+        if font.size(text)[0] <= width:
+            return text
+        while text and font.size(text + "...")[0] > width:
+            text = text[:-1]
+        return text.rstrip() + "..."
+
+    def _draw_track(self, window):
+        # Host checks the answer against the song that was playing
+        track = self.track
+        details = [
+            value for value in (track.year, format_duration(track.duration)) if value
+        ]
+        lines = [(self.fonts.medium, track.title)]
+        if track.artist:
+            lines += [(self.fonts.small, track.artist)]
+        if details:
+            lines += [(self.fonts.small, " | ".join(details))]
+        top = self.rect.top + self.rect.height * 0.35
+        for font, line in lines:
+            text_surface = text_cache.render(
+                font, self._fit(font, line), FONT_PALETTE[Colors.BLACK][self.mode]
+            )
+            text_rect = text_surface.get_rect(midtop=(self.rect.centerx, top))
+            window.blit(text_surface, text_rect)
+            top += font.get_height()
+
+    def _draw_overlay(self, window):
+        for line_num, line in enumerate(self.overlay):
+            text_surface = text_cache.render(
+                self.fonts.small, line, FONT_PALETTE[Colors.BLACK][ColorModes.DARK]
+            )
+            text_rect = text_surface.get_rect(
+                topleft=(
+                    self.rect.left + 4,
+                    self.rect.top + 4 + line_num * self.fonts.small.get_height(),
+                )
+            )
+            window.blit(text_surface, text_rect)
+
+    def _draw_static(self, surface, rect):
+        super()._draw_static(surface, rect)
+        text_surface = text_cache.render(
+            self.fonts.medium, "Round", FONT_PALETTE[Colors.BLACK][self.mode]
         )
         text_rect = text_surface.get_rect(
             center=(
-                self.index * RECTANGLE_WIDTH + RECTANGLE_WIDTH // 2,
-                WINDOW_HEIGHT // 2,
+                rect.centerx,
+                rect.top + rect.height // 2,
             )
         )
-        window.blit(text_surface, text_rect)
+        surface.blit(text_surface, text_rect)
 
-        text_surface = font_big.render(
-            str(round_counter) if round_counter > 0 else "INTRO", True, FONT_PALETTE[Colors.BLACK][self.mode]
+    def _draw_round_counter(self, window, round_counter=0):
+        text_surface = text_cache.render(
+            self.fonts.big, str(round_counter) if round_counter > 0 else "INTRO", FONT_PALETTE[Colors.BLACK][self.mode]
         )
         text_rect = text_surface.get_rect(
             center=(
-                self.index * RECTANGLE_WIDTH + RECTANGLE_WIDTH // 2,
-                WINDOW_HEIGHT // 1.8,
+                self.rect.centerx,
+                self.rect.top + self.rect.height // 1.8,
             )
         )
         window.blit(text_surface, text_rect)
@@ -233,13 +474,13 @@ class HostCard(BoardCard):
         match self.player.host_state:
             case HostState.IDLE:
                 message = ""
-                text_surface = font_medium.render(
-                    message, True, FONT_PALETTE[Colors.BLACK][self.mode]
+                text_surface = text_cache.render(
+                    self.fonts.medium, message, FONT_PALETTE[Colors.BLACK][self.mode]
                 )
                 text_rect = text_surface.get_rect(
                     center=(
-                        self.index * RECTANGLE_WIDTH + RECTANGLE_WIDTH // 2,
-                        WINDOW_HEIGHT // 1.2,
+                        self.rect.centerx,
+                        self.rect.top + self.rect.height // 1.2,
                     )
                 )
                 window.blit(text_surface, text_rect)
@@ -249,14 +490,15 @@ class HostCard(BoardCard):
                 lines += ["SPACE - skip/introduce player"]
                 # Render each line separately
                 for line_num, line in enumerate(lines):
-                    text_surface = font_small.render(
-                        line, True, (FONT_PALETTE[Colors.BLACK][self.mode])
+                    text_surface = text_cache.render(
+                        self.fonts.small, line, (FONT_PALETTE[Colors.BLACK][self.mode])
                     )
                     text_rect = text_surface.get_rect(
                         center=(
-                            self.index * RECTANGLE_WIDTH + RECTANGLE_WIDTH // 2,
-                            WINDOW_HEIGHT // 1.3
-                            + (line_num - len(lines) // 2) * font_small.get_height(),
+                            self.rect.centerx,
+                            self.rect.top + self.rect.height // 1.3
+                            + (line_num - len(lines) // 2)
+                            * self.fonts.small.get_height(),
                         )
                     )
                     window.blit(text_surface, text_rect)
@@ -267,14 +509,15 @@ class HostCard(BoardCard):
                 lines += ["C - play"]
                 # Render each line separately
                 for line_num, line in enumerate(lines):
-                    text_surface = font_small.render(
-                        line, True, (FONT_PALETTE[Colors.BLACK][self.mode])
+                    text_surface = text_cache.render(
+                        self.fonts.small, line, (FONT_PALETTE[Colors.BLACK][self.mode])
                     )
                     text_rect = text_surface.get_rect(
                         center=(
-                            self.index * RECTANGLE_WIDTH + RECTANGLE_WIDTH // 2,
-                            WINDOW_HEIGHT // 1.3
-                            + (line_num - len(lines) // 2) * font_small.get_height(),
+                            self.rect.centerx,
+                            self.rect.top + self.rect.height // 1.3
+                            + (line_num - len(lines) // 2)
+                            * self.fonts.small.get_height(),
                         )
                     )
                     window.blit(text_surface, text_rect)
@@ -287,14 +530,15 @@ class HostCard(BoardCard):
                 lines += ["0 - give penalty"]
                 # Render each line separately
                 for line_num, line in enumerate(lines):
-                    text_surface = font_small.render(
-                        line, True, (FONT_PALETTE[Colors.BLACK][self.mode])
+                    text_surface = text_cache.render(
+                        self.fonts.small, line, (FONT_PALETTE[Colors.BLACK][self.mode])
                     )
                     text_rect = text_surface.get_rect(
                         center=(
-                            self.index * RECTANGLE_WIDTH + RECTANGLE_WIDTH // 2,
-                            WINDOW_HEIGHT // 1.3
-                            + (line_num - len(lines) // 2) * font_small.get_height(),
+                            self.rect.centerx,
+                            self.rect.top + self.rect.height // 1.3
+                            + (line_num - len(lines) // 2)
+                            * self.fonts.small.get_height(),
                         )
                     )
                     window.blit(text_surface, text_rect)
@@ -305,6 +549,9 @@ class HostCard(BoardCard):
         super().draw(window)
         self._draw_round_counter(window, round_counter=round_counter)
         self._draw_message(window)
+        if self.player.host_state == HostState.RANKING and self.track is not None:
+            self._draw_track(window)
+        self._draw_overlay(window)
 
 
 class GameBoard:
@@ -313,50 +560,115 @@ class GameBoard:
         self.host_card = None
         self.player_cards = []
         self.placeholder_cards = []
+        self._cards_by_number = {}
+        self._layout_size = None
+        self._repaint = False  # Whole window needs a display update
         self._init_cards(players)
+        self.layout()
 
     def _init_cards(self, players):
         # Create players cards:
         for player in players:
             card = PlayerCard(
                 index=player.number,
-                color=Colors(player.number),
+                palette=player_palette(player.number),
                 name=f"Player {player.number}",
                 device="joystick",
                 player=player,
             )
             card.mode = ColorModes.LIGHT
             self.player_cards += [card]
+            self._cards_by_number[player.number] = card
         # Make the rest of players inactive:
         active_players = len(self.player_cards)
         for i in range(0, NUM_RECTANGLES - len(self.player_cards) - 1):
             number = active_players + i
-            card = BoardCard(index=number, color=Colors(number))
+            card = BoardCard(index=number, palette=player_palette(number))
             card.mode = ColorModes.INACTIVE
             self.placeholder_cards += [card]
         # Create host card:
         self.host_card = HostCard(
-            index=NUM_RECTANGLES - 1,
-            color=Colors.RED,
+            index=len(self.player_cards) + len(self.placeholder_cards),
+            palette=CARD_PALETTE[Colors.RED],
             name="The Host",
             device="keyboard",
         )
         self.host_card.mode = ColorModes.LIGHT
 
+    @property
+    def cards(self):
+        return self.player_cards + self.placeholder_cards + [self.host_card]
+
+    def layout(self):
+        """Place cards in a grid fitting the current window size."""
+        self._layout_size = self.window.get_size()
+        cards = self.cards
+        rects, scale = grid_layout(*self._layout_size, len(cards))
+        fonts = scaled_fonts(scale)
+        for card in cards:
+            card.place(rects[card.index], fonts)
+        # Clear what the old layout left outside of the new cards:
+        self.window.fill((0, 0, 0))
+        self._repaint = True
+
+    def resize(self):
+        """Rebuild layout, fonts and card layers after the window was resized."""
+        self.window = pygame.display.get_surface()
+        if self.window.get_size() == self._layout_size:
+            return
+        # Texts rendered with fonts of the old size are not needed anymore
+        text_cache.clear()
+        self.layout()
+
+    def add_player(self, player, name=None, device="remote"):
+        """Add a card of a player who joined during the game."""
+        card = PlayerCard(
+            index=player.number,
+            palette=player_palette(player.number),
+            name=f"Player {player.number}" if name is None else name,
+            device=device,
+            player=player,
+        )
+        card.mode = ColorModes.LIGHT
+        # Take the place of the first inactive card or push the host further:
+        if self.placeholder_cards:
+            self.placeholder_cards.pop(0)
+        else:
+            self.host_card.index += 1
+        self.player_cards += [card]
+        self._cards_by_number[player.number] = card
+        self.layout()
+        return card
+
     def get_player_card(self, index):
-        for card in self.player_cards:
-            if index == card.player.number:
-                return card
+        return self._cards_by_number.get(index)
+
+    def invalidate(self):
+        """Force a full repaint, e.g. after the window was exposed."""
+        for card in self.cards:
+            card.invalidate()
 
     # Draw gameboard
     def draw(self, round_counter=0):
-        # Draw Player cards from left:
+        dirty_rects = []
+        # Draw Player cards first:
         for card in self.player_cards:
-            card.draw(self.window)
+            dirty_rects += [card.redraw(self.window)]
         # Draw placeholder cards:
         for card in self.placeholder_cards:
-            card.draw(self.window)
-        # Draw Host on the right:
-        self.host_card.draw(self.window, round_counter=round_counter)
-        # Update display
-        pygame.display.update()
+            dirty_rects += [card.redraw(self.window)]
+        # Draw Host in the last place:
+        host_rect = self.host_card.redraw(self.window, round_counter=round_counter)
+        # Spectrum changes every frame, the rest of the host card rarely:
+        visualizer_rect = self.host_card.redraw_visualizer(
+            self.window, force=host_rect is not None
+        )
+        dirty_rects += [host_rect or visualizer_rect]
+        # Update only the parts of display that changed:
+        dirty_rects = [rect for rect in dirty_rects if rect is not None]
+        if self._repaint:
+            dirty_rects = [self.window.get_rect()]
+            self._repaint = False
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
+        return dirty_rects
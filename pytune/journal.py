@@ -0,0 +1,112 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class Journal:
+    """
+    Append-only log of game events, so results survive a crash or Esc.
+    Recording an event only appends it to an in-memory queue. A writer
+    thread stores queued events in batches every flush_interval seconds
+    and calls fsync at most once every sync_interval seconds.
+    Each line is a compact JSON list: [monotonic ns, kind, *arguments].
+    """
+
+    def __init__(self, path, resume=False, flush_interval=0.2, sync_interval=2.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.sync_interval = sync_interval
+        self._pending = deque()
+        self._file = open(path, "a", encoding="utf-8")
+        self._stopped = threading.Event()
+        self._unsynced = False
+        # Sessions start with a header telling if they continue the last game:
+        self.record("resume" if resume else "new", time.time())
+        self._writer = threading.Thread(
+            target=self._run, name="pytune-journal", daemon=True
+        )
+        self._writer.start()
+        atexit.register(self.close)
+
+    def record(self, kind, *args):
+        self._pending.append((time.monotonic_ns(), kind, args))
+
+    def _write_pending(self):
+        lines = []
+        while self._pending:
+            timestamp, kind, args = self._pending.popleft()
+            lines += [json.dumps([timestamp, kind, *args], separators=(",", ":"))]
+        if lines:
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+            self._unsynced = True
+
+    def _sync(self):
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = False
+
+    def _run(self):
+        last_sync = time.monotonic()
+        while not self._stopped.wait(self.flush_interval):
+            self._write_pending()
+            if time.monotonic() - last_sync >= self.sync_interval:
+                self._sync()
+                last_sync = time.monotonic()
+
+    def close(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._writer.join()
+        self._write_pending()
+        self._sync()
+        self._file.close()
+
+
+def read_journal(path):
+    """Returns events of the last game: (timestamp, kind, args) tuples."""
+    events = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                timestamp, kind, *args = json.loads(line)
+            except ValueError:
+                # Last line can be cut short by a crash
+                continue
+            if kind == "new":
+                events = []
+            events += [(timestamp, kind, args)]
+    return events
+
+
+class GameRecord:
+    """State of a game rebuilt by replaying its journal."""
+
+    def __init__(self):
+        self.points = {}
+        self.round_counter = 0
+        self.songs = []
+        self.league_game = None  # Id of the game in the league file
+
+    def apply(self, kind, args):
+        match kind:
+            case "next":
+                self.round_counter += 1
+                self.songs += [args[0]]
+            case "plus":
+                self.points[args[0]] = self.points.get(args[0], 0) + 1
+            case "minus":
+                self.points[args[0]] = self.points.get(args[0], 0) - 1
+            case "league":
+                self.league_game = args[0]
+
+    @classmethod
+    def replay(cls, path):
+        record = cls()
+        for _, kind, args in read_journal(path):
+            record.apply(kind, args)
+        return record
@@ -0,0 +1,317 @@
+"""
+League results of all games, kept in a SQLite file.
+
+Results of a round are queued when the round ends and a writer thread
+stores them, so the game loop never waits for the disk. Triggers keep
+running totals of players and songs in every season, and head-to-head
+records are read through an index, so leaderboards print right away
+even after thousands of games. To print them:
+
+    python -m pytune.leaderboard ./pytune-leaderboard.sqlite
+"""
+
+import argparse
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from .logger import init_logger, setup_logging
+
+logger = init_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    season TEXT NOT NULL
+);
+-- Players of every game, also the ones who never scored
+CREATE TABLE IF NOT EXISTS entries (
+    name TEXT NOT NULL,
+    game INTEGER NOT NULL,
+    PRIMARY KEY (name, game)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS results (
+    game INTEGER NOT NULL,
+    round INTEGER NOT NULL,
+    player TEXT NOT NULL,
+    delta INTEGER NOT NULL,
+    reaction REAL,
+    song TEXT NOT NULL
+);
+-- Running totals of seasons, kept by triggers, so leaderboards
+-- are read without going through all results
+CREATE TABLE IF NOT EXISTS standings (
+    season TEXT NOT NULL,
+    player TEXT NOT NULL,
+    games INTEGER NOT NULL DEFAULT 0,
+    points INTEGER NOT NULL DEFAULT 0,
+    right INTEGER NOT NULL DEFAULT 0,
+    wrong INTEGER NOT NULL DEFAULT 0,
+    reactions INTEGER NOT NULL DEFAULT 0,
+    reaction_total REAL NOT NULL DEFAULT 0.0,
+    PRIMARY KEY (season, player)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS song_totals (
+    season TEXT NOT NULL,
+    song TEXT NOT NULL,
+    answers INTEGER NOT NULL DEFAULT 0,
+    right INTEGER NOT NULL DEFAULT 0,
+    reactions INTEGER NOT NULL DEFAULT 0,
+    reaction_total REAL NOT NULL DEFAULT 0.0,
+    PRIMARY KEY (season, song)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS games_by_season ON games (season, id);
+CREATE INDEX IF NOT EXISTS results_by_game ON results (game, player, delta);
+CREATE TRIGGER IF NOT EXISTS count_entry AFTER INSERT ON entries BEGIN
+    INSERT INTO standings (season, player, games)
+    VALUES ((SELECT season FROM games WHERE id = NEW.game), NEW.name, 1)
+    ON CONFLICT DO UPDATE SET games = games + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS count_result AFTER INSERT ON results BEGIN
+    INSERT INTO standings (season, player)
+    VALUES ((SELECT season FROM games WHERE id = NEW.game), NEW.player)
+    ON CONFLICT DO NOTHING;
+    UPDATE standings SET
+        points = points + NEW.delta,
+        right = right + (NEW.delta > 0),
+        wrong = wrong + (NEW.delta < 0),
+        reactions = reactions + (NEW.delta > 0 AND NEW.reaction IS NOT NULL),
+        reaction_total = reaction_total
+            + IIF(NEW.delta > 0, IFNULL(NEW.reaction, 0.0), 0.0)
+    WHERE season = (SELECT season FROM games WHERE id = NEW.game)
+        AND player = NEW.player;
+    INSERT INTO song_totals (season, song)
+    VALUES ((SELECT season FROM games WHERE id = NEW.game), NEW.song)
+    ON CONFLICT DO NOTHING;
+    UPDATE song_totals SET
+        answers = answers + 1,
+        right = right + (NEW.delta > 0),
+        reactions = reactions + (NEW.delta > 0 AND NEW.reaction IS NOT NULL),
+        reaction_total = reaction_total
+            + IIF(NEW.delta > 0, IFNULL(NEW.reaction, 0.0), 0.0)
+    WHERE season = (SELECT season FROM games WHERE id = NEW.game)
+        AND song = NEW.song;
+END;
+"""
+
+ENTRY_QUERY = "INSERT OR IGNORE INTO entries VALUES (?, ?)"
+RESULT_QUERY = "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)"
+
+Standing = namedtuple(
+    "Standing", ("player", "games", "points", "right", "wrong", "reaction")
+)
+Record = namedtuple("Record", ("games", "wins", "losses", "draws"))
+SongRecord = namedtuple("SongRecord", ("song", "answers", "right", "reaction"))
+
+
+def default_season():
+    """Seasons are calendar years, unless named otherwise."""
+    return time.strftime("%Y")
+
+
+def connect(path):
+    db = sqlite3.connect(path)
+    # Leaderboards can be read while a game writes its results:
+    db.execute("PRAGMA journal_mode = WAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+class RoundClock:
+    """Time the song of a round was playing, pauses excluded."""
+
+    def __init__(self):
+        self._played = 0.0
+        self._since = None  # None while paused
+        self._paused_at = 0.0
+
+    def start(self, now):
+        self._played = 0.0
+        self._since = now
+
+    def pause(self, now):
+        if self._since is not None:
+            self._played += now - self._since
+            self._since = None
+            self._paused_at = now
+
+    def resume(self, now):
+        if self._since is None:
+            self._since = now
+
+    def played(self, at):
+        """Playing time until `at`, which can be a press before the pause."""
+        if self._since is not None:
+            return self._played + at - self._since
+        return max(self._played - max(self._paused_at - at, 0.0), 0.0)
+
+
+class Leaderboard:
+    """
+    Writes results of one game to the league file.
+    Rows of a round are queued at its end, the writer thread
+    stores each queued round in a single transaction.
+    A resumed game passes its `game` id and goes on as the same game.
+    """
+
+    def __init__(self, path, season=None, players=(), game=None):
+        self.path = path
+        db = connect(path)
+        with db:
+            if game is None:
+                self.season = season or default_season()
+                game = db.execute(
+                    "INSERT INTO games (started, season) VALUES (?, ?)",
+                    (time.time(), self.season),
+                ).lastrowid
+            else:
+                (self.season,) = db.execute(
+                    "SELECT season FROM games WHERE id = ?", (game,)
+                ).fetchone()
+        db.close()
+        self.game = game
+        self._queue = queue.Queue()
+        self.join(players)
+        self._writer = threading.Thread(
+            target=self._run,
+            name="pytune-leaderboard",
+            daemon=True,
+        )
+        self._writer.start()
+        atexit.register(self.close)
+
+    def join(self, names):
+        """Add players to the game, e.g. remote ones joining later."""
+        # Players already in the game are ignored, so are not counted twice
+        self._queue.put((ENTRY_QUERY, [(name,) for name in names]))
+
+    def record_round(self, rows):
+        """Store (round, player, delta, reaction, song) rows of a round."""
+        if rows:
+            self._queue.put((RESULT_QUERY, list(rows)))
+
+    def _run(self):
+        db = connect(self.path)
+        game = self.game
+        while (item := self._queue.get()) is not None:
+            query, rows = item
+            if query == ENTRY_QUERY:
+                rows = [(name, game) for name, in rows]
+            else:
+                rows = [(game, *row) for row in rows]
+            try:
+                with db:
+                    db.executemany(query, rows)
+            except sqlite3.Error as error:
+                logger.warning("Cannot store results in '%s': %s", self.path, error)
+        db.close()
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+
+def latest_season(db):
+    rows = db.execute("SELECT season FROM games ORDER BY id DESC LIMIT 1").fetchall()
+    return rows[0][0] if rows else default_season()
+
+
+def season_totals(db, season):
+    """Standings of a season, best players first."""
+    rows = db.execute(
+        "SELECT player, games, points, right, wrong, "
+        "reaction_total / NULLIF(reactions, 0) FROM standings WHERE season = ? "
+        "ORDER BY points DESC, games, player",
+        (season,),
+    )
+    return [Standing(*row) for row in rows]
+
+
+def head_to_head(db, season, first, second):
+    """Games of a season played by both players, won by the first of them."""
+    rows = db.execute(
+        "WITH together AS (SELECT entries.game FROM entries JOIN entries AS other "
+        "ON other.game = entries.game AND other.name = ? "
+        "JOIN games ON games.id = entries.game "
+        "WHERE entries.name = ? AND games.season = ?), "
+        "points AS (SELECT together.game, "
+        "(SELECT IFNULL(SUM(delta), 0) FROM results "
+        "WHERE player = ? AND game = together.game) AS first, "
+        "(SELECT IFNULL(SUM(delta), 0) FROM results "
+        "WHERE player = ? AND game = together.game) AS second FROM together) "
+        "SELECT COUNT(*), IFNULL(SUM(first > second), 0), "
+        "IFNULL(SUM(first < second), 0), IFNULL(SUM(first = second), 0) FROM points",
+        (second, first, season, first, second),
+    )
+    return Record(*rows.fetchone())
+
+
+def hardest_songs(db, season, count=10, min_answers=3):
+    """Songs with the fewest right answers, the slowest ones first on a tie."""
+    rows = db.execute(
+        "SELECT song, answers, right, reaction_total / NULLIF(reactions, 0) "
+        "AS reaction FROM song_totals WHERE season = ? AND answers >= ? "
+        "ORDER BY 1.0 * right / answers, reaction DESC, answers DESC LIMIT ?",
+        (season, min_answers, count),
+    )
+    return [SongRecord(*row) for row in rows]
+
+
+def _seconds(value):
+    return "-" if value is None else f"{value:.2f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path", help="league file written with --leaderboard")
+    parser.add_argument(
+        "--season", default=None, help="season to show, the latest one by default"
+    )
+    parser.add_argument(
+        "--versus",
+        nargs=2,
+        metavar="PLAYER",
+        help="head-to-head record of two players instead of the standings",
+    )
+    parser.add_argument("--songs", type=int, default=10, help="hardest songs shown")
+    args = parser.parse_args()
+    setup_logging()
+
+    db = connect(args.path)
+    season = args.season or latest_season(db)
+    if args.versus:
+        first, second = args.versus
+        record = head_to_head(db, season, first, second)
+        print(f"{first} vs {second}, season {season}: {record.games} games")
+        print(f"{record.wins} wins, {record.losses} losses, {record.draws} draws")
+        db.close()
+        return
+    print(f"Season {season}")
+    print(
+        f"{'#':>3} {'Player':<20} {'Games':>5} {'Points':>6} "
+        f"{'+':>5} {'-':>5} Reaction"
+    )
+    for place, standing in enumerate(season_totals(db, season), 1):
+        print(
+            f"{place:>3} {standing.player[:20]:<20} {standing.games:>5} "
+            f"{standing.points:>6} {standing.right:>5} {standing.wrong:>5} "
+            f"{_seconds(standing.reaction)}"
+        )
+    if args.songs:
+        print()
+        print("Hardest songs")
+        for song in hardest_songs(db, season, args.songs):
+            print(
+                f"{song.right}/{song.answers} right, "
+                f"{_seconds(song.reaction)}: {song.song}"
+            )
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
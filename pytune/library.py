@@ -0,0 +1,202 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+import soundfile
+
+from .logger import init_logger
+
+
+logger = init_logger(__name__)
+
+SONG_EXTENSIONS = (".mp3", ".wav")
+# Size of each chunk read for the content hash
+HASH_CHUNK_SIZE = 64 * 1024
+# Number of changed files stored in a single transaction
+BATCH_SIZE = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    duration REAL,
+    samplerate INTEGER,
+    hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS songs_hash ON songs (hash);
+"""
+
+
+def content_hash(path, size):
+    """
+    Hash the file size together with chunks from the start, middle
+    and end of the file. Reading whole files from a slow disk takes
+    far too long, while sampled chunks still tell files apart.
+    """
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    offsets = {
+        0,
+        max(size // 2 - HASH_CHUNK_SIZE // 2, 0),
+        max(size - HASH_CHUNK_SIZE, 0),
+    }
+    with open(path, "rb") as file:
+        for offset in sorted(offsets):
+            file.seek(offset)
+            digest.update(file.read(HASH_CHUNK_SIZE))
+    return digest.hexdigest()
+
+
+def default_index_path(folder):
+    """
+    Index of a song folder in the user cache. The folder itself can be
+    read-only or on a slow USB disk, so nothing is written there.
+    """
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    key = hashlib.blake2b(os.path.abspath(folder).encode(), digest_size=8).hexdigest()
+    return os.path.join(cache, "pytune", f"library-{key}.sqlite")
+
+
+def scan_files(root):
+    """Recursively yield (relative path, size, mtime) of every song under root."""
+    folders = [root]
+    while folders:
+        with os.scandir(folders.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    folders += [entry.path]
+                elif entry.name.lower().endswith(SONG_EXTENSIONS) and entry.is_file():
+                    song = os.path.relpath(entry.path, root)
+                    stat = entry.stat()
+                    yield song, stat.st_size, stat.st_mtime_ns
+
+
+class SongLibrary:
+    """
+    Persistent index of songs in a folder (and its subfolders).
+    A refresh only opens files that were added or changed since
+    the last scan, based on their size and modification time.
+    """
+
+    def __init__(self, path, index_path=None):
+        # Check if the folder exists
+        if not os.path.isdir(path):
+            raise OSError(f"Folder '{path}' does not exist!")
+        self.path = path
+        self.index_path = index_path or default_index_path(path)
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.index_path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._scan_thread = None
+        self._stop_scan = threading.Event()
+
+    def create_tables(self, schema):
+        """Create tables used by other parts of pytune to keep per-song data."""
+        with self._lock:
+            self._db.executescript(schema)
+
+    def execute(self, query, params=()):
+        with self._lock, self._db:
+            return self._db.execute(query, params).fetchall()
+
+    def executemany(self, query, rows):
+        with self._lock, self._db:
+            self._db.executemany(query, rows)
+
+    def songs(self):
+        """Return relative paths of all indexed songs."""
+        return [path for path, in self.execute("SELECT path FROM songs ORDER BY path")]
+
+    def info(self, song):
+        """Return indexed information about a song or None if it is unknown."""
+        rows = self.execute(
+            "SELECT size, mtime, duration, samplerate, hash FROM songs WHERE path = ?",
+            (song,),
+        )
+        if not rows:
+            return None
+        return dict(zip(("size", "mtime", "duration", "samplerate", "hash"), rows[0]))
+
+    def _describe(self, song, size, mtime):
+        full_path = os.path.join(self.path, song)
+        try:
+            info = soundfile.info(full_path)
+            duration, samplerate = info.duration, info.samplerate
+        except RuntimeError:
+            # Unsupported by libsndfile, still playable by pygame
+            duration, samplerate = None, None
+        return (song, size, mtime, duration, samplerate, content_hash(full_path, size))
+
+    def _store(self, rows):
+        self.executemany("INSERT OR REPLACE INTO songs VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def refresh(self):
+        """
+        Update the index with files added, changed or removed since the last scan.
+        Returns songs that were not in the index before.
+        """
+        known = {
+            path: (size, mtime)
+            for path, size, mtime in self.execute(
+                "SELECT path, size, mtime FROM songs"
+            )
+        }
+        seen = set()
+        changed = []
+        added = []
+        updated = 0
+        for song, size, mtime in scan_files(self.path):
+            if self._stop_scan.is_set():
+                return []
+            seen.add(song)
+            if known.get(song) == (size, mtime):
+                continue
+            try:
+                changed += [self._describe(song, size, mtime)]
+            except OSError as error:
+                logger.warning("Cannot index '%s': %s", song, error)
+                continue
+            if song not in known:
+                added += [song]
+            if len(changed) >= BATCH_SIZE:
+                self._store(changed)
+                updated += len(changed)
+                changed = []
+        self._store(changed)
+        updated += len(changed)
+        removed = [(song,) for song in known.keys() - seen]
+        self.executemany("DELETE FROM songs WHERE path = ?", removed)
+        logger.sound(
+            "Library index: %d songs, %d updated, %d removed.",
+            len(seen),
+            updated,
+            len(removed),
+        )
+        return added
+
+    def refresh_in_background(self, on_added=None):
+        """Refresh in a thread, on_added gets the new songs when it is done."""
+        self._scan_thread = threading.Thread(
+            target=self._refresh,
+            args=(on_added,),
+            name="pytune-library-scan",
+            daemon=True,
+        )
+        self._scan_thread.start()
+
+    def _refresh(self, on_added):
+        added = self.refresh()
+        if added and on_added is not None:
+            on_added(added)
+
+    def close(self):
+        self._stop_scan.set()
+        if self._scan_thread is not None:
+            self._scan_thread.join()
+        self._db.close()
@@ -1,30 +1,91 @@
-import coloredlogs, logging
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
 
+import coloredlogs
 
-def create_level(logger, constant, name, color):
-    logging.addLevelName(constant, name)
-    coloredlogs.DEFAULT_LEVEL_STYLES[name.lower()] = {"color": color}
+# Custom levels of pytune messages: name -> (level, color)
+LEVELS = {
+    "game": (logging.INFO + 5, "white"),
+    "host": (logging.INFO + 6, "red"),
+    "player": (logging.INFO + 7, "yellow"),
+    "sound": (logging.INFO + 8, "cyan"),
+    "song": (logging.INFO + 9, "green"),
+}
 
-    def level_function(msg, *args, **kwargs):
-        # Capture logger from here
-        if logger.isEnabledFor(constant):
-            logger.log(constant, msg)
+for name, (level, color) in LEVELS.items():
+    logging.addLevelName(level, name.upper())
+    coloredlogs.DEFAULT_LEVEL_STYLES[name] = {"color": color}
+
+_listener = None
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Puts records on the queue as they are. Messages are formatted
+    later by the listener thread instead of the thread that logs.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=None):
+    """
+    Set up the logging pipeline, or only change its level if it exists.
+    Records go through a queue to a listener thread, which formats them
+    and writes to the terminal, so a slow console never blocks the game.
+    Level defaults to PYTUNE_LOG_LEVEL environment variable or DEBUG.
+    """
+    global _listener
+    if _listener is None:
+        level = level or os.environ.get("PYTUNE_LOG_LEVEL", "DEBUG")
+        handler = logging.StreamHandler()
+        coloredlogs.HostNameFilter.install(
+            handler=handler, fmt=coloredlogs.DEFAULT_LOG_FORMAT
+        )
+        coloredlogs.ProgramNameFilter.install(
+            handler=handler, fmt=coloredlogs.DEFAULT_LOG_FORMAT
+        )
+        if coloredlogs.terminal_supports_colors(handler.stream):
+            formatter = coloredlogs.ColoredFormatter(
+                fmt=coloredlogs.DEFAULT_LOG_FORMAT,
+                datefmt=coloredlogs.DEFAULT_DATE_FORMAT,
+            )
         else:
-            raise RuntimeError("Unknown logger!")
+            formatter = logging.Formatter(
+                fmt=coloredlogs.DEFAULT_LOG_FORMAT,
+                datefmt=coloredlogs.DEFAULT_DATE_FORMAT,
+            )
+        handler.setFormatter(formatter)
+        records = queue.SimpleQueue()
+        logging.getLogger().addHandler(DeferredQueueHandler(records))
+        _listener = QueueListener(records, handler)
+        _listener.start()
+        # Flush remaining records on exit:
+        atexit.register(_listener.stop)
+    if level is not None:
+        logging.getLogger().setLevel(level.upper() if isinstance(level, str) else level)
+
+
+def create_level(logger, level):
+    def level_function(msg, *args, **kwargs):
+        # Disabled levels are dropped before any formatting happens
+        if logger.isEnabledFor(level):
+            logger.log(level, msg, *args, **kwargs)
 
     return level_function
 
 
 def init_logger(name):
-    # Initialize logger
+    # Initialize logger, records are written once setup_logging is called.
+    # Importing pytune starts no threads, e.g. in spawned worker processes.
     logger = logging.getLogger(name)
-    coloredlogs.install(level="DEBUG")
 
     # Add custom commands to logger
-    logger.game = create_level(logger, logging.INFO + 5, "GAME", "white")
-    logger.host = create_level(logger, logging.INFO + 6, "HOST", "red")
-    logger.player = create_level(logger, logging.INFO + 7, "PLAYER", "yellow")
-    logger.sound = create_level(logger, logging.INFO + 8, "SOUND", "cyan")
-    logger.song = create_level(logger, logging.INFO + 9, "SONG", "green")
+    for level_name, (level, _) in LEVELS.items():
+        setattr(logger, level_name, create_level(logger, level))
 
     return logger
@@ -0,0 +1,140 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import soundfile
+
+from .logger import init_logger
+
+
+logger = init_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS loudness (
+    hash TEXT PRIMARY KEY,
+    loudness REAL NOT NULL,
+    peak REAL NOT NULL
+);
+"""
+
+# Songs are normalized to this loudness (in dB relative to full scale)
+TARGET_LOUDNESS = -20.0
+# Length of analysis blocks (in seconds)
+BLOCK_LENGTH = 0.4
+# Gating of quiet blocks, as in ITU-R BS.1770
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+
+def _to_db(power):
+    return 10 * np.log10(np.maximum(power, 1e-12))
+
+
+def analyze_loudness(path):
+    """
+    Returns (integrated loudness in dB, sample peak) of a song file.
+    The file is streamed in blocks, so memory use does not depend on
+    the song length. Loudness is the gated mean power of blocks like in
+    ITU-R BS.1770, but without its K-weighting filter.
+    """
+    blocksize = int(soundfile.info(path).samplerate * BLOCK_LENGTH)
+    powers = []
+    peak = 0.0
+    for block in soundfile.blocks(
+        path, blocksize=blocksize, dtype="float32", always_2d=True
+    ):
+        peak = max(peak, float(np.abs(block).max(initial=0.0)))
+        # Power of a block is the sum of channel mean squares
+        powers += [float(np.square(block).mean(axis=0).sum())]
+    powers = np.array(powers)
+    levels = _to_db(powers)
+    gated = powers[levels > ABSOLUTE_GATE]
+    if len(gated) == 0:
+        return ABSOLUTE_GATE, peak
+    threshold = max(_to_db(gated.mean()) + RELATIVE_GATE, ABSOLUTE_GATE)
+    return float(_to_db(powers[levels > threshold].mean())), peak
+
+
+class LoudnessAnalyzer:
+    """
+    Keeps loudness of songs in the library index, keyed by file hash.
+    Songs without a result are analyzed in a process pool, started from
+    a background thread, so the game never waits for the analysis.
+    """
+
+    def __init__(self, library, workers=None):
+        self.library = library
+        self.library.create_tables(SCHEMA)
+        self.workers = workers
+        self._results = {
+            song_hash: (loudness, peak)
+            for song_hash, loudness, peak in self.library.execute(
+                "SELECT hash, loudness, peak FROM loudness"
+            )
+        }
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def _analyze(self, songs):
+        missing = {}
+        for song in songs:
+            info = self.library.info(song)
+            if info is not None and info["hash"] not in self._results:
+                missing[info["hash"]] = song
+        if not missing:
+            return
+        logger.sound("Analyzing loudness of %d songs...", len(missing))
+        # Spawn workers, forking a process with pygame and threads is unsafe
+        with ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = {
+                executor.submit(
+                    analyze_loudness, os.path.join(self.library.path, song)
+                ): song_hash
+                for song_hash, song in missing.items()
+            }
+            for future in as_completed(futures):
+                if self._stopped.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    return
+                try:
+                    loudness, peak = future.result()
+                except (OSError, RuntimeError) as error:
+                    logger.warning(
+                        "Cannot analyze '%s': %s", missing[futures[future]], error
+                    )
+                    continue
+                self._results[futures[future]] = (loudness, peak)
+                self.library.execute(
+                    "INSERT OR REPLACE INTO loudness VALUES (?, ?, ?)",
+                    (futures[future], loudness, peak),
+                )
+        logger.sound("Loudness analysis finished.")
+
+    def analyze_in_background(self, songs):
+        self._thread = threading.Thread(
+            target=self._analyze,
+            args=(list(songs),),
+            name="pytune-loudness",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def gain(self, song):
+        """Linear gain bringing the song to the target loudness without clipping."""
+        info = self.library.info(song)
+        if info is None or info["hash"] not in self._results:
+            return 1.0
+        loudness, peak = self._results[info["hash"]]
+        gain = 10 ** ((TARGET_LOUDNESS - loudness) / 20)
+        if peak > 0:
+            gain = min(gain, 1.0 / peak)
+        return gain
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
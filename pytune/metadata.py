@@ -0,0 +1,245 @@
+"""
+Title, artist and year of songs, read from their tags.
+
+MP3 files carry ID3 tags, which are parsed here directly: reading a
+tag takes a few small reads and no decoding. Other formats are read
+through libsndfile. Results are kept in the library index, keyed by
+file hash, so only new or changed files are read.
+"""
+
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import soundfile
+
+from .logger import init_logger
+
+
+logger = init_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    hash TEXT PRIMARY KEY,
+    title TEXT,
+    artist TEXT,
+    year TEXT
+);
+"""
+
+# Reading tags waits on the disk, not the CPU, so threads are enough
+WORKERS = 8
+# Tags stored in a single transaction
+BATCH_SIZE = 100
+# Tags larger than this are not read (in bytes), they hold big pictures
+MAX_TAG_SIZE = 4 * 1024**2
+
+# Frames of ID3v2.3 and 2.4 tags, with ID3v2.2 names in brackets
+ID3_FRAMES = {
+    b"TIT2": "title",
+    b"TT2": "title",
+    b"TPE1": "artist",
+    b"TP1": "artist",
+    b"TYER": "year",
+    b"TYE": "year",
+    b"TDRC": "year",
+}
+ID3_ENCODINGS = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}
+
+TrackInfo = namedtuple("TrackInfo", ("title", "artist", "year", "duration"))
+
+
+def format_track(track):
+    """One line description of a TrackInfo, e.g. for logs."""
+    text = track.title if track.artist is None else f"{track.artist} - {track.title}"
+    details = [
+        value for value in (track.year, format_duration(track.duration)) if value
+    ]
+    return f"{text} ({', '.join(details)})" if details else text
+
+
+def format_duration(duration):
+    if duration is None:
+        return None
+    minutes, seconds = divmod(round(duration), 60)
+    return f"{minutes}:{seconds:02}"
+
+
+def _syncsafe(data):
+    # 7 bits per byte, the highest bit is always 0
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _text(frame):
+    # Text frames start with an encoding byte, values end with a null
+    encoding = ID3_ENCODINGS.get(frame[0]) if frame else None
+    if encoding is None:
+        return None
+    text = frame[1:].decode(encoding, errors="replace")
+    return text.split("\x00")[0].strip() or None
+
+
+def parse_id3v2(tag):
+    """Returns a dict of title, artist and year found in an ID3v2 tag."""
+    version, flags = tag[3], tag[5]
+    body = tag[10:]
+    if flags & 0x80 and version < 4:
+        # Unsynchronisation of the whole tag
+        body = body.replace(b"\xff\x00", b"\xff")
+    position = 0
+    if flags & 0x40 and version >= 3:
+        # Extended header, sized without itself in 2.3 and with it in 2.4
+        size = int.from_bytes(body[:4], "big")
+        position = _syncsafe(body[:4]) if version == 4 else size + 4
+    id_length, header_length = (3, 6) if version == 2 else (4, 10)
+    found = {}
+    while position + header_length <= len(body):
+        frame_id = body[position : position + id_length]
+        if not frame_id.strip(b"\x00"):
+            break  # Padding
+        size_bytes = body[position + id_length : position + 2 * id_length]
+        if version == 4:
+            size = _syncsafe(size_bytes)
+        else:
+            size = int.from_bytes(size_bytes, "big")
+        start = position + header_length
+        key = ID3_FRAMES.get(frame_id)
+        if key is not None and key not in found:
+            value = _text(body[start : start + size])
+            if value is not None:
+                found[key] = value[:4] if key == "year" else value
+        position = start + size
+    return found
+
+
+def parse_id3v1(tail):
+    """Returns a dict of title, artist and year from the last 128 bytes of a file."""
+    if len(tail) < 128 or tail[:3] != b"TAG":
+        return {}
+    fields = {"title": tail[3:33], "artist": tail[33:63], "year": tail[93:97]}
+    found = {}
+    for key, value in fields.items():
+        value = value.split(b"\x00")[0].decode("latin-1").strip()
+        if value:
+            found[key] = value
+    return found
+
+
+def read_tags(path):
+    """Returns (title, artist, year) of a song file, each of them can be None."""
+    if path.lower().endswith(".mp3"):
+        found = {}
+        with open(path, "rb") as file:
+            head = file.read(10)
+            if len(head) == 10 and head[:3] == b"ID3":
+                size = _syncsafe(head[6:10])
+                if size <= MAX_TAG_SIZE:
+                    found = parse_id3v2(head + file.read(size))
+            if len(found) < 3:
+                file.seek(0, os.SEEK_END)
+                file.seek(max(file.tell() - 128, 0))
+                found = {**parse_id3v1(file.read(128)), **found}
+    else:
+        with soundfile.SoundFile(path) as file:
+            tags = file.copy_metadata()
+        found = {
+            "title": tags.get("title"),
+            "artist": tags.get("artist"),
+            "year": tags.get("date", "")[:4] or None,
+        }
+    return found.get("title"), found.get("artist"), found.get("year")
+
+
+def _read(path):
+    # Errors are returned, one bad file must not stop the whole batch
+    try:
+        return read_tags(path), None
+    except (OSError, RuntimeError, ValueError, IndexError) as error:
+        return (None, None, None), str(error)
+
+
+class MetadataIndex:
+    """
+    Keeps tags of songs in the library index, keyed by file hash.
+    Songs without them are read by a thread pool, started from a
+    background thread, so the game never waits for the tags.
+    """
+
+    def __init__(self, library, workers=WORKERS):
+        self.library = library
+        self.library.create_tables(SCHEMA)
+        self.workers = workers
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def get(self, song):
+        """TrackInfo of a song, the title is the file name if it has no tags."""
+        rows = self.library.execute(
+            "SELECT metadata.title, metadata.artist, metadata.year, songs.duration "
+            "FROM songs LEFT JOIN metadata ON songs.hash = metadata.hash "
+            "WHERE songs.path = ?",
+            (song,),
+        )
+        title, artist, year, duration = rows[0] if rows else (None,) * 4
+        if title is None:
+            title = os.path.splitext(os.path.basename(song))[0]
+        return TrackInfo(title, artist, year, duration)
+
+    def missing(self, songs):
+        """Hashes and paths of songs whose tags were never read."""
+        rows = self.library.execute(
+            "SELECT songs.path, songs.hash FROM songs LEFT JOIN metadata "
+            "ON songs.hash = metadata.hash WHERE metadata.hash IS NULL"
+        )
+        unread = dict(rows)
+        missing = {}
+        # Keep the order of given songs, upcoming ones are read first
+        for song in songs:
+            if song in unread:
+                missing.setdefault(unread[song], song)
+        return missing
+
+    def extract(self, songs):
+        missing = self.missing(songs)
+        if not missing:
+            return
+        logger.sound("Reading tags of %d songs...", len(missing))
+        paths = [os.path.join(self.library.path, song) for song in missing.values()]
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="pytune-tags"
+        ) as executor:
+            rows = []
+            for (song_hash, song), (tags, error) in zip(
+                missing.items(), executor.map(_read, paths)
+            ):
+                if self._stopped.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+                if error is not None:
+                    logger.warning("Cannot read tags of '%s': %s", song, error)
+                rows += [(song_hash, *tags)]
+                if len(rows) >= BATCH_SIZE:
+                    self._store(rows)
+                    rows = []
+            self._store(rows)
+        logger.sound("Reading tags finished.")
+
+    def _store(self, rows):
+        self.library.executemany(
+            "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)", rows
+        )
+
+    def extract_in_background(self, songs):
+        self._thread = threading.Thread(
+            target=self.extract,
+            args=(list(songs),),
+            name="pytune-metadata",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
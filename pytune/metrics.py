@@ -0,0 +1,135 @@
+import json
+import time
+from array import array
+from contextlib import contextmanager
+
+import numpy as np
+
+from .logger import init_logger
+
+
+logger = init_logger(__name__)
+
+
+class SampleRing:
+    """Keeps the last `size` samples in a preallocated array."""
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.count = 0
+        self._samples = array("d", bytes(8 * size))
+
+    def add(self, value):
+        self._samples[self.count % self.size] = value
+        self.count += 1
+
+    def values(self):
+        """Samples kept in the ring, oldest first."""
+        values = np.frombuffer(self._samples, dtype=np.float64)
+        if self.count <= self.size:
+            return values[: self.count]
+        # Ring wrapped, the oldest sample is the next one to be overwritten:
+        start = self.count % self.size
+        return np.concatenate((values[start:], values[:start]))
+
+    def percentiles(self, *percents):
+        values = self.values()
+        if len(values) == 0:
+            return [float("nan")] * len(percents)
+        return list(np.percentile(values, percents))
+
+
+class Metrics:
+    """
+    Latency and frame time samples of the running game.
+    Times are in seconds, queue depth is the number of events
+    handled after a single wake-up of the game loop.
+    """
+
+    NAMES = (
+        "draw_time",
+        "queue_depth",
+        "buzz_to_pause",
+        "buzz_to_highlight",
+        "visualizer_time",
+    )
+    # Minimal time between overlay updates (in seconds)
+    OVERLAY_INTERVAL = 0.5
+
+    def __init__(self, size=1024):
+        self.rings = {name: SampleRing(size) for name in self.NAMES}
+        self.overlay = False
+        self._overlay_lines = ()
+        self._overlay_updated = 0.0
+
+    def add(self, name, value):
+        self.rings[name].add(value)
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        self._overlay_updated = 0.0
+
+    def overlay_lines(self):
+        """Lines of the debug overlay, refreshed at most every OVERLAY_INTERVAL."""
+        if not self.overlay:
+            return ()
+        now = time.perf_counter()
+        if now - self._overlay_updated >= self.OVERLAY_INTERVAL:
+            lines = []
+            for name, ring in self.rings.items():
+                p50, p99 = ring.percentiles(50, 99)
+                if name == "queue_depth":
+                    lines += [f"{name}: p50 {p50:.0f} p99 {p99:.0f}"]
+                else:
+                    lines += [f"{name}: p50 {p50 * 1000:.1f} p99 {p99 * 1000:.1f} ms"]
+            self._overlay_lines = tuple(lines)
+            self._overlay_updated = now
+        return self._overlay_lines
+
+    def export(self, path):
+        report = {}
+        for name, ring in self.rings.items():
+            p50, p90, p99 = [
+                None if np.isnan(value) else value
+                for value in ring.percentiles(50, 90, 99)
+            ]
+            report[name] = {
+                "count": ring.count,
+                "p50": p50,
+                "p90": p90,
+                "p99": p99,
+                "samples": ring.values().tolist(),
+            }
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+class StartupTimer:
+    """Measures phases of the game startup and logs them in one line."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []  # (name, duration) of each phase
+        self.marks = []  # (name, time since start) of notable moments
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases += [(name, time.perf_counter() - start)]
+
+    def mark(self, name):
+        """Note a moment of the startup, e.g. when the intro music started."""
+        self.marks += [(name, time.perf_counter() - self.started)]
+
+    def report(self):
+        total = time.perf_counter() - self.started
+        phases = ", ".join(
+            f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases
+        )
+        marks = "".join(
+            f", {name} after {seconds * 1000:.0f} ms" for name, seconds in self.marks
+        )
+        logger.game("Startup took %.0f ms (%s)%s", total * 1000, phases, marks)
@@ -0,0 +1,259 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pygame
+import soundfile
+
+try:
+    import sounddevice
+except OSError:  # PortAudio library is not installed
+    sounddevice = None
+
+
+# Number of mixer channels reserved by pytune, see reserve_channels
+_reserved_channels = 0
+
+
+def reserve_channels(count):
+    """
+    Reserve mixer channels 0..count-1, so pygame.mixer.Sound.play never
+    picks them. Channels reserved earlier stay reserved.
+    """
+    global _reserved_channels
+    if count > _reserved_channels:
+        if pygame.mixer.get_num_channels() < count:
+            pygame.mixer.set_num_channels(count)
+        pygame.mixer.set_reserved(count)
+        _reserved_channels = count
+
+
+class MixerBackend:
+    """
+    Plays songs through the pygame mixer.
+    Files on disk are streamed with pygame.mixer.music. Decoded WAV
+    buffers are played as a pygame.mixer.Sound on a reserved channel,
+    and other in-memory data is streamed from a temporary file.
+    pygame.mixer.music must not stream from Python file objects: the
+    audio thread then needs the GIL to read them, which deadlocks with
+    mixer calls like pause made from the game loop.
+    """
+
+    # Channel reserved for songs played from memory
+    CHANNEL = 0
+
+    def __init__(self):
+        self._sound = None
+        self._channel = None
+        self._spill_path = None
+        self._gain = 1.0
+
+    def load(self, source, namehint=""):
+        self.unload()
+        if isinstance(source, str):
+            pygame.mixer.music.load(source)
+        elif namehint == "wav":
+            self._sound = pygame.mixer.Sound(file=source)
+        else:
+            with tempfile.NamedTemporaryFile(
+                suffix=f".{namehint}", prefix="pytune-", delete=False
+            ) as file:
+                file.write(source.read())
+                self._spill_path = file.name
+            pygame.mixer.music.load(self._spill_path)
+
+    def play(self):
+        if self._sound is not None:
+            reserve_channels(self.CHANNEL + 1)
+            self._channel = pygame.mixer.Channel(self.CHANNEL)
+            self._channel.play(self._sound)
+            self._channel.set_volume(self._gain)
+        else:
+            pygame.mixer.music.play()
+
+    def pause(self):
+        if self._channel is not None:
+            self._channel.pause()
+        else:
+            pygame.mixer.music.pause()
+
+    def unpause(self):
+        if self._channel is not None:
+            self._channel.unpause()
+        else:
+            pygame.mixer.music.unpause()
+
+    def set_gain(self, gain):
+        # Mixer volume cannot go above 1.0, so it can only attenuate
+        self._gain = min(gain, 1.0)
+        pygame.mixer.music.set_volume(self._gain)
+        if self._channel is not None:
+            self._channel.set_volume(self._gain)
+
+    def unload(self):
+        if self._channel is not None:
+            self._channel.stop()
+            self._channel = None
+        self._sound = None
+        # Free resources if possible:
+        try:
+            pygame.mixer.music.unload()
+        except pygame.error:
+            pass
+        if self._spill_path is not None:
+            os.remove(self._spill_path)
+            self._spill_path = None
+
+
+class RingBuffer:
+    """
+    Preallocated ring buffer of audio frames. It is safe for a single
+    writer thread and a single reader (the audio callback), each of
+    them only moving its own position.
+    """
+
+    def __init__(self, frames, channels):
+        self.data = np.zeros((frames, channels), dtype="float32")
+        self.frames = frames
+        self.channels = channels
+        self.read_position = 0
+        self.write_position = 0
+
+    def clear(self):
+        self.read_position = 0
+        self.write_position = 0
+
+    def available(self):
+        return self.write_position - self.read_position
+
+    def space(self):
+        return self.frames - self.available()
+
+    def write(self, block):
+        # Caller makes sure there is enough space for the block
+        count = len(block)
+        start = self.write_position % self.frames
+        first = min(count, self.frames - start)
+        self.data[start : start + first] = block[:first]
+        self.data[: count - first] = block[first:]
+        self.write_position += count
+
+    def read_into(self, out):
+        # Missing frames are filled with silence
+        count = min(len(out), self.available())
+        start = self.read_position % self.frames
+        first = min(count, self.frames - start)
+        out[:first] = self.data[start : start + first]
+        out[first:count] = self.data[: count - first]
+        out[count:] = 0
+        self.read_position += count
+        return count
+
+
+class StreamBackend:
+    """
+    Streams songs through a sounddevice callback.
+    A feeder thread decodes blocks of the song into a ring buffer,
+    while the callback only copies from it. Pausing makes the callback
+    output silence, so the music stops within one small block instead
+    of the whole pygame mixer buffer.
+    """
+
+    def __init__(self, blocksize=256, buffered_blocks=32, latency="low"):
+        if sounddevice is None:
+            raise RuntimeError("Stream backend requires the PortAudio library!")
+        self.blocksize = blocksize
+        self.buffered_blocks = buffered_blocks
+        self.latency = latency
+        self.paused = False
+        self.gain = 1.0
+        self._ring = None
+        self._chunk = None
+        self._file = None
+        self._stream = None
+        self._feeder = None
+        self._stopped = threading.Event()
+        self._consumed = threading.Event()
+
+    def _allocate(self, channels):
+        # Buffers are reused between songs with the same channel count
+        if self._ring is None or self._ring.channels != channels:
+            self._ring = RingBuffer(self.blocksize * self.buffered_blocks, channels)
+            self._chunk = np.zeros((self.blocksize * 4, channels), dtype="float32")
+        self._ring.clear()
+
+    def _feed(self):
+        while not self._stopped.is_set():
+            if self._ring.space() < len(self._chunk):
+                # Wait for the callback to make some space
+                self._consumed.wait(timeout=0.1)
+                self._consumed.clear()
+                continue
+            block = self._file.read(out=self._chunk)
+            if len(block) == 0:
+                return
+            self._ring.write(block)
+
+    def _callback(self, outdata, frames, time, status):
+        if self.paused:
+            outdata.fill(0)
+            return
+        self._ring.read_into(outdata)
+        if self.gain != 1.0:
+            outdata *= self.gain
+        self._consumed.set()
+
+    def load(self, source, namehint=""):
+        self.unload()
+        self._file = soundfile.SoundFile(source)
+        self._allocate(self._file.channels)
+        self._stream = sounddevice.OutputStream(
+            samplerate=self._file.samplerate,
+            channels=self._file.channels,
+            dtype="float32",
+            blocksize=self.blocksize,
+            latency=self.latency,
+            callback=self._callback,
+        )
+
+    def play(self):
+        self.paused = False
+        self._stopped.clear()
+        self._feeder = threading.Thread(
+            target=self._feed, name="pytune-stream-feeder", daemon=True
+        )
+        self._feeder.start()
+        self._stream.start()
+
+    def pause(self):
+        self.paused = True
+        # Intro music plays through pygame.mixer.music before any song
+        if self._stream is None and pygame.mixer.get_init():
+            pygame.mixer.music.pause()
+
+    def unpause(self):
+        self.paused = False
+        if self._stream is None and pygame.mixer.get_init():
+            pygame.mixer.music.unpause()
+
+    def set_gain(self, gain):
+        self.gain = gain
+
+    def unload(self):
+        self._stopped.set()
+        if self._feeder is not None:
+            self._feeder.join()
+            self._feeder = None
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+BACKENDS = {
+    "mixer": MixerBackend,
+    "stream": StreamBackend,
+}
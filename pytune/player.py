@@ -36,6 +36,37 @@ class Player:
         self.player_state = PlayerState.WIN
 
 
+class PlayerRegistry:
+    """
+    Players in the order they joined, numbered from 0.
+    Players are found by number or by the instance id of their
+    joystick in constant time, so no event needs a scan of all players.
+    """
+
+    def __init__(self):
+        self._players = []
+        self._by_instance_id = {}
+
+    def add(self, joystick):
+        player = Player(len(self._players), joystick)
+        self._players += [player]
+        self._by_instance_id[joystick.get_instance_id()] = player
+        return player
+
+    def get(self, instance_id):
+        """Player using the joystick with given instance id, or None."""
+        return self._by_instance_id.get(instance_id)
+
+    def __getitem__(self, number):
+        return self._players[number]
+
+    def __iter__(self):
+        return iter(self._players)
+
+    def __len__(self):
+        return len(self._players)
+
+
 class HostState(Enum):
     IDLE = 0
     INTRO = 1
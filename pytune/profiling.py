@@ -0,0 +1,132 @@
+"""
+Profiling of the running game on demand.
+
+A profile covers a window of frames or rounds. While it lasts, cProfile
+traces calls of the game loop and tracemalloc traces allocations, both
+are off otherwise. At the end of the window a report is written next to
+the game, together with the raw profile for tools like snakeviz:
+
+    pytune-profile-20261018-201500.txt
+    pytune-profile-20261018-201500.prof
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+
+from .logger import init_logger
+
+
+logger = init_logger(__name__)
+
+# Functions and lines listed in each part of the report
+TOP_COUNT = 25
+# Modules whose allocations are listed on their own
+WATCHED_MODULES = ("graphics.py", "sound.py")
+
+
+class Profiler:
+    """
+    Profiles the next `frames` frames, or the next `rounds` rounds
+    if they are given. Game calls frame_done and round_started only
+    while the profiler is active, so it costs nothing otherwise.
+    """
+
+    def __init__(self, folder=".", frames=600, rounds=None):
+        self.folder = folder
+        self.frames = frames
+        self.rounds = rounds
+        self.active = False
+        self._profile = None
+        self._snapshot = None
+        self._started_at = 0.0
+        self._frame_count = 0
+        self._round_count = 0
+        self._stop_tracing = False
+
+    def toggle(self):
+        """Start a profile, or end the running one early."""
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+
+    def start(self):
+        if self.active:
+            return
+        # Tracing could be on already, e.g. with PYTHONTRACEMALLOC set
+        self._stop_tracing = not tracemalloc.is_tracing()
+        if self._stop_tracing:
+            tracemalloc.start()
+        self._snapshot = tracemalloc.take_snapshot()
+        self._frame_count = self._round_count = 0
+        self._started_at = time.perf_counter()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        self.active = True
+        window = f"{self.rounds} rounds" if self.rounds else f"{self.frames} frames"
+        logger.game("Profiling the next %s...", window)
+
+    def frame_done(self):
+        self._frame_count += 1
+        if not self.rounds and self._frame_count >= self.frames:
+            self.stop()
+
+    def round_started(self):
+        # The round in progress when the profile started is not counted
+        if self.rounds and self._round_count >= self.rounds:
+            self.stop()
+        else:
+            self._round_count += 1
+
+    def stop(self):
+        """End the profile and write its report, returns the report path."""
+        if not self.active:
+            return None
+        self._profile.disable()
+        duration = time.perf_counter() - self._started_at
+        snapshot = tracemalloc.take_snapshot()
+        if self._stop_tracing:
+            tracemalloc.stop()
+        self.active = False
+        name = time.strftime("pytune-profile-%Y%m%d-%H%M%S")
+        path = os.path.join(self.folder, name)
+        self._profile.dump_stats(f"{path}.prof")
+        with open(f"{path}.txt", "w", encoding="utf-8") as file:
+            file.write(self._report(snapshot, duration))
+        self._profile = self._snapshot = None
+        logger.game("Profile saved to '%s.txt'.", path)
+        return f"{path}.txt"
+
+    def _report(self, snapshot, duration):
+        lines = [
+            f"Profile of {self._frame_count} frames and {self._round_count} rounds "
+            f"in {duration:.2f} s",
+            "",
+        ]
+        for order in ("cumulative", "tottime"):
+            stream = io.StringIO()
+            stats = pstats.Stats(self._profile, stream=stream)
+            stats.sort_stats(order).print_stats(TOP_COUNT)
+            lines += [f"=== Top functions by {order} time ===", stream.getvalue()]
+        # Allocations made during the profile and still alive at its end:
+        ignored = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+        ]
+        growth = snapshot.filter_traces(ignored).compare_to(
+            self._snapshot.filter_traces(ignored), "lineno"
+        )
+        lines += ["=== Top allocations by line ==="]
+        lines += [str(stat) for stat in growth[:TOP_COUNT]]
+        for module in WATCHED_MODULES:
+            lines += ["", f"=== Allocations in {module} ==="]
+            lines += [
+                str(stat)
+                for stat in growth
+                if stat.traceback[0].filename.endswith(os.sep + module)
+            ][:TOP_COUNT]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,355 @@
+"""
+Buzzer server for players on the local network.
+
+Clients talk to the game with JSON datagrams over UDP:
+
+    client -> {"type": "hello", "name": "Ala"}
+    server -> {"type": "welcome", "id": 1000}
+    server -> {"type": "ping", "t0": <server time>}
+    client -> {"type": "pong", "t0": <server time>, "t1": <client time>}
+    client -> {"type": "buzz", "t": <client time>}
+    server -> {"type": "rumble", "duration": 2}
+
+Presses become the same JOYBUTTONDOWN events joysticks produce, with
+the press time translated to the game clock. A scripted swarm of
+clients with skewed clocks checks the server on loopback:
+
+    python -m pytune.remote --clients 32 --rounds 20
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pygame
+
+from .logger import init_logger, setup_logging
+
+
+logger = init_logger(__name__)
+
+# Posted when a new remote player says hello, carries the `joystick`
+PLAYER_JOINED = pygame.event.custom_type()
+
+DEFAULT_PORT = 9177
+# Instance ids of remote players start here, far from real joysticks
+REMOTE_INSTANCE_ID_BASE = 1000
+MAX_CLIENTS = 64
+# How often clock offsets of clients are measured (in seconds)
+PING_INTERVAL = 1.0
+# Offset is taken from the fastest of this many last round trips
+OFFSET_SAMPLES = 8
+# Press travels at most one round trip of its client (one-way delay and
+# the error of the offset), plus this jitter (in seconds)
+PRESS_JITTER = 0.005
+# Press is never older than this on arrival, whatever the round trip
+MAX_PRESS_AGE = 0.05
+
+
+class RemoteJoystick:
+    """Stands in for pygame.joystick.Joystick of a remote player."""
+
+    def __init__(self, server, address, instance_id, name, joined_at=0.0):
+        self.server = server
+        self.address = address
+        self.instance_id = instance_id
+        self.name = name
+        self.joined_at = joined_at  # Arrival of the first hello
+        # Round trip times and clock offsets of the last pings
+        self._samples = deque(maxlen=OFFSET_SAMPLES)
+
+    def init(self):
+        pass
+
+    def get_init(self):
+        return True
+
+    def get_name(self):
+        return self.name
+
+    def get_instance_id(self):
+        return self.instance_id
+
+    def rumble(self, low_frequency, high_frequency, duration):
+        self.server.send(self.address, {"type": "rumble", "duration": duration})
+        return True
+
+    def stop_rumble(self):
+        self.server.send(self.address, {"type": "rumble", "duration": 0})
+
+    def add_sample(self, sent_at, client_time, received_at):
+        round_trip = received_at - sent_at
+        # Client clock minus game clock, assuming symmetric network delay
+        offset = client_time - (sent_at + round_trip / 2)
+        self._samples.append((round_trip, offset))
+
+    @property
+    def offset(self):
+        if not self._samples:
+            return None
+        return min(self._samples)[1]
+
+    def press_time(self, client_time, received_at):
+        """
+        Time of a press on the game clock, never later than its arrival
+        and never before the player joined.
+        Clients cannot back-date presses by more than their round trip,
+        so no one wins close races against local joysticks by lying.
+        """
+        if not self._samples:
+            return received_at
+        round_trip, offset = min(self._samples)
+        max_age = min(round_trip + PRESS_JITTER, MAX_PRESS_AGE)
+        earliest = max(received_at - max_age, self.joined_at)
+        return min(max(client_time - offset, earliest), received_at)
+
+
+class BuzzerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def connection_made(self, transport):
+        self.server.transport = transport
+
+    def datagram_received(self, data, address):
+        received_at = time.perf_counter()
+        try:
+            message = json.loads(data)
+            self.server.handle(message, address, received_at)
+        except (ValueError, TypeError, KeyError) as error:
+            logger.debug("Bad datagram from %s: %s", address, error)
+
+
+class BuzzerServer:
+    """
+    UDP server running its own asyncio loop in a background thread.
+    Clients are pinged regularly to estimate offsets of their clocks.
+    Events go to `post`, pygame.event.post by default, which is safe to
+    call from any thread and wakes up the game loop.
+    """
+
+    def __init__(self, host="0.0.0.0", port=DEFAULT_PORT, post=None):
+        self.host = host
+        self.port = port
+        self.post = pygame.event.post if post is None else post
+        self.transport = None
+        self.clients = {}  # Address -> RemoteJoystick
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._error = None  # Error of opening the socket, raised by start
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="pytune-buzzer", daemon=True
+        )
+        self._thread.start()
+        self._started.wait()
+        if self._error is not None:
+            self._thread.join()
+            self._thread = None
+            raise OSError(
+                f"Cannot listen on {self.host}:{self.port}: {self._error}"
+            ) from self._error
+        logger.game("Buzzer server listening on %s:%s", self.host, self.port)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(
+                self._loop.create_datagram_endpoint(
+                    lambda: BuzzerProtocol(self), local_addr=(self.host, self.port)
+                )
+            )
+            # Port 0 picks a free port, report the real one:
+            self.port = self.transport.get_extra_info("sockname")[1]
+        except OSError as error:
+            # E.g. the port is taken, start() raises it in the game thread
+            self._error = error
+        finally:
+            self._started.set()
+        if self._error is not None:
+            self._loop.close()
+            return
+        ping_task = self._loop.create_task(self._ping_clients())
+        self._loop.run_forever()
+        ping_task.cancel()
+        self.transport.close()
+        self._loop.run_until_complete(asyncio.sleep(0))
+        self._loop.close()
+
+    async def _ping_clients(self):
+        while True:
+            for address in list(self.clients):
+                self._send({"type": "ping", "t0": time.perf_counter()}, address)
+            await asyncio.sleep(PING_INTERVAL)
+
+    def _send(self, message, address):
+        self.transport.sendto(json.dumps(message).encode(), address)
+
+    def send(self, address, message):
+        """Send a message to a client from any thread."""
+        self._loop.call_soon_threadsafe(self._send, message, address)
+
+    def handle(self, message, address, received_at):
+        client = self.clients.get(address)
+        match message["type"]:
+            case "hello":
+                if client is None:
+                    if len(self.clients) >= MAX_CLIENTS:
+                        logger.warning("Too many remote players, ignoring %s", address)
+                        return
+                    client = RemoteJoystick(
+                        self,
+                        address,
+                        REMOTE_INSTANCE_ID_BASE + len(self.clients),
+                        str(message.get("name", f"Remote {len(self.clients)}"))[:20],
+                        joined_at=received_at,
+                    )
+                    self.clients[address] = client
+                    # Stamped with its arrival, so the join is sorted
+                    # before the first press of the player:
+                    self.post(
+                        pygame.event.Event(
+                            PLAYER_JOINED, joystick=client, timestamp=received_at
+                        )
+                    )
+                # Hello is repeated until the client gets welcomed
+                self._send({"type": "welcome", "id": client.instance_id}, address)
+                self._send({"type": "ping", "t0": time.perf_counter()}, address)
+            case "pong" if client is not None:
+                client.add_sample(
+                    float(message["t0"]), float(message["t1"]), received_at
+                )
+            case "buzz" if client is not None:
+                self.post(
+                    pygame.event.Event(
+                        pygame.JOYBUTTONDOWN,
+                        instance_id=client.instance_id,
+                        button=0,
+                        timestamp=client.press_time(float(message["t"]), received_at),
+                    )
+                )
+
+    def close(self):
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+
+class SwarmClient(asyncio.DatagramProtocol):
+    """Scripted client with a skewed clock and a fixed one-way delay."""
+
+    def __init__(self, name, skew, delay):
+        self.name = name
+        self.skew = skew
+        self.delay = delay
+        self.transport = None
+        self.welcomed = asyncio.Event()
+
+    def clock(self):
+        return time.perf_counter() + self.skew
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        asyncio.get_running_loop().call_later(self.delay, self._handle, data)
+
+    def _handle(self, data):
+        message = json.loads(data)
+        match message["type"]:
+            case "welcome":
+                self.welcomed.set()
+            case "ping":
+                self.send({"type": "pong", "t0": message["t0"], "t1": self.clock()})
+
+    def send(self, message):
+        data = json.dumps(message).encode()
+        asyncio.get_running_loop().call_later(self.delay, self.transport.sendto, data)
+
+    def buzz(self):
+        self.send({"type": "buzz", "t": self.clock()})
+
+
+async def run_swarm(port, clients, rounds, rng):
+    loop = asyncio.get_running_loop()
+    swarm = []
+    for number in range(clients):
+        _, client = await loop.create_datagram_endpoint(
+            lambda: SwarmClient(
+                f"Swarm {number}", rng.uniform(-100, 100), rng.uniform(0.001, 0.02)
+            ),
+            remote_addr=("127.0.0.1", port),
+        )
+        swarm += [client]
+    for client in swarm:
+        while not client.welcomed.is_set():
+            client.send({"type": "hello", "name": client.name})
+            await asyncio.sleep(0.05)
+    # Let the server measure clock offsets:
+    await asyncio.sleep(PING_INTERVAL * 2.5)
+    pressed = []
+    for _ in range(rounds):
+        # Several players press within a few milliseconds:
+        for client in rng.sample(swarm, min(len(swarm), 8)):
+            pressed += [(client.name, time.perf_counter())]
+            client.buzz()
+            await asyncio.sleep(rng.uniform(0, 0.005))
+        await asyncio.sleep(0.1)
+    return pressed
+
+
+def percentiles(samples):
+    p50, p99 = np.percentile(np.abs(samples), [50, 99]) * 1000
+    return f"p50 {p50:.3f} ms, p99 {p99:.3f} ms, max {max(np.abs(samples)) * 1000:.3f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    setup_logging()
+
+    received = []
+    server = BuzzerServer(host="127.0.0.1", port=0, post=received.append)
+    server.start()
+    pressed = asyncio.run(
+        run_swarm(server.port, args.clients, args.rounds, random.Random(args.seed))
+    )
+    time.sleep(0.1)
+    server.close()
+
+    # Presses of a client arrive in the order they were sent:
+    sent = {}
+    for name, actual in pressed:
+        sent.setdefault(name, deque()).append(actual)
+    names = {
+        joystick.instance_id: joystick.name for joystick in server.clients.values()
+    }
+    buzzes = [
+        (names[event.instance_id], event.timestamp)
+        for event in received
+        if event.type == pygame.JOYBUTTONDOWN
+    ]
+    errors = [estimated - sent[name].popleft() for name, estimated in buzzes]
+    order = [name for name, _ in sorted(buzzes, key=lambda buzz: buzz[1])]
+    misordered = sum(
+        expected != actual for (expected, _), actual in zip(pressed, order)
+    )
+    print(f"Clients:          {len(server.clients)}")
+    print(f"Presses:          {len(pressed)} sent, {len(buzzes)} received")
+    print(f"Press time error: {percentiles(errors)}")
+    print(f"Out of order:     {misordered} presses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Song rotation kept across game sessions.
+
+Plays are stored in the library index, keyed by file hash. Songs played
+recently are drawn less often, so regular players do not hear the same
+songs every game. Draws use a Fenwick tree of weights, O(log n) each,
+and a drawn song is never repeated in a session.
+"""
+
+import random
+import time
+from collections import deque
+
+from .logger import init_logger
+
+
+logger = init_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plays (
+    hash TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    last_played REAL NOT NULL
+);
+"""
+
+# Weights are integers, so sums in the tree stay exact
+FRESH_WEIGHT = 1000
+# Song played right before is still drawn, only 100 times less often
+MIN_WEIGHT = 10
+# Song gets its full weight back after this time (in seconds)
+REST_TIME = 30 * 24 * 3600
+# Plays stored in a single transaction
+FLUSH_SIZE = 10
+
+
+class FenwickTree:
+    """Non-negative integer weights with prefix sums in O(log n)."""
+
+    def __init__(self, weights):
+        self.weights = list(weights)
+        size = len(self.weights)
+        self._tree = [0] + self.weights
+        # Build in O(n), each node adds itself to its parent:
+        for index in range(1, size + 1):
+            parent = index + (index & -index)
+            if parent <= size:
+                self._tree[parent] += self._tree[index]
+        self._top = 1 << size.bit_length() if size else 0
+
+    def __len__(self):
+        return len(self.weights)
+
+    def total(self):
+        index, result = len(self.weights), 0
+        while index > 0:
+            result += self._tree[index]
+            index -= index & -index
+        return result
+
+    def update(self, position, weight):
+        delta = weight - self.weights[position]
+        self.weights[position] = weight
+        index = position + 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def find(self, value):
+        """Position whose weight covers value, for 0 <= value < total()."""
+        position, step = 0, self._top
+        while step:
+            index = position + step
+            if index < len(self._tree) and self._tree[index] <= value:
+                position = index
+                value -= self._tree[index]
+            step >>= 1
+        return position
+
+
+class Rotation:
+    """
+    Queue of songs for a session.
+    In random order, songs are drawn with weights growing with the time
+    since they were last played. Otherwise they keep the given order.
+    """
+
+    def __init__(self, library, songs, random_order=True, seed=None):
+        self.library = library
+        self.library.create_tables(SCHEMA)
+        self.songs = list(songs)
+        self.random_order = random_order
+        self._random = random.Random(seed)
+        self._positions = {song: position for position, song in enumerate(self.songs)}
+        last_played = self._last_played()
+        now = time.time()
+        self._tree = FenwickTree(
+            self._weight(last_played.get(song), now) for song in self.songs
+        )
+        self._left = len(self.songs)
+        self._next_position = 0
+        # Songs already drawn, but not played yet
+        self._upcoming = deque()
+        self._plays = []
+        logger.sound(
+            "Rotation: %d songs, %d played in earlier sessions.",
+            len(self.songs),
+            len(last_played),
+        )
+
+    def _last_played(self):
+        return dict(
+            self.library.execute(
+                "SELECT songs.path, plays.last_played "
+                "FROM songs JOIN plays ON songs.hash = plays.hash"
+            )
+        )
+
+    @staticmethod
+    def _weight(last_played, now):
+        if last_played is None:
+            return FRESH_WEIGHT
+        rested = min(max(now - last_played, 0.0) / REST_TIME, 1.0)
+        return max(int(FRESH_WEIGHT * rested), MIN_WEIGHT)
+
+    def __len__(self):
+        return self._left + len(self._upcoming)
+
+    def _draw(self):
+        if not self._left:
+            return None
+        weights = self._tree.weights
+        if self.random_order:
+            position = self._tree.find(self._random.randrange(self._tree.total()))
+        else:
+            while not weights[self._next_position]:
+                self._next_position += 1
+            position = self._next_position
+        self._tree.update(position, 0)
+        self._left -= 1
+        return self.songs[position]
+
+    def upcoming(self, count):
+        """Next songs to be played, without taking them from the queue."""
+        while len(self._upcoming) < count and self._left:
+            self._upcoming.append(self._draw())
+        return list(self._upcoming)[:count]
+
+    def next(self):
+        """Take the next song from the queue, None if there are no more."""
+        if self._upcoming:
+            return self._upcoming.popleft()
+        return self._draw()
+
+    def remove(self, songs):
+        """Take songs (e.g. played in a restored game) out of the queue."""
+        removed = set(songs)
+        self._upcoming = deque(song for song in self._upcoming if song not in removed)
+        for song in removed:
+            position = self._positions.get(song)
+            if position is not None and self._tree.weights[position]:
+                self._tree.update(position, 0)
+                self._left -= 1
+
+    def add(self, songs):
+        """Put songs found during the session (e.g. by a rescan) into the queue."""
+        songs = [song for song in dict.fromkeys(songs) if song not in self._positions]
+        if not songs:
+            return
+        # A renamed song keeps its plays, they are stored by hash:
+        last_played = self._last_played()
+        now = time.time()
+        for song in songs:
+            self._positions[song] = len(self.songs)
+            self.songs += [song]
+        # Rebuilt in O(n), songs are added once or twice in a session:
+        self._tree = FenwickTree(
+            self._tree.weights
+            + [self._weight(last_played.get(song), now) for song in songs]
+        )
+        self._left += len(songs)
+
+    def record(self, song):
+        """Remember that song was played, stored in batches."""
+        info = self.library.info(song)
+        if info is None:
+            return
+        self._plays += [(info["hash"], time.time())]
+        if len(self._plays) >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.library.executemany(
+            "INSERT INTO plays VALUES (?, 1, ?) ON CONFLICT (hash) DO UPDATE "
+            "SET count = count + 1, last_played = excluded.last_played",
+            self._plays,
+        )
+        self._plays = []
@@ -0,0 +1,68 @@
+import time
+
+import pygame
+
+
+def stamp_events(events):
+    """
+    Make sure every event carries a `timestamp` in seconds on the
+    time.perf_counter clock. pygame does not expose SDL timestamps,
+    so events without one are stamped as soon as they are drained
+    from the queue. Events posted by pytune itself can carry their
+    own (earlier) press time instead.
+    """
+    now = time.perf_counter()
+    for event in events:
+        if getattr(event, "timestamp", None) is None:
+            event.timestamp = now
+    # Stable sort keeps SDL queue order for events stamped together:
+    events.sort(key=lambda event: event.timestamp)
+    return events
+
+
+class FrameScheduler:
+    """
+    Paces the game loops.
+    While the board keeps changing, frames are scheduled at target_fps.
+    Once a frame draws nothing, the loop drops to idle_fps and sleeps
+    in pygame.event.wait, so any input wakes it up immediately.
+    With vsync enabled the display update already waits for the screen
+    refresh, so the frame after a display update is not delayed any
+    further. Frames which updated nothing keep the frame timer.
+    """
+
+    def __init__(self, target_fps=30, idle_fps=2, vsync=False):
+        self.frame_time = 1.0 / target_fps
+        self.idle_time = 1.0 / idle_fps
+        self.vsync = vsync
+        self.idle = False
+        self._updated = False  # Last frame updated the display
+        self._next_frame = time.perf_counter()
+
+    def wait_events(self):
+        """
+        Block until the next frame is due or input arrives, then drain
+        everything that is queued. Events are returned in press order.
+        """
+        timeout = self._next_frame - time.perf_counter()
+        if self.vsync and self._updated:
+            timeout = 0
+        events = []
+        if timeout > 0:
+            event = pygame.event.wait(int(timeout * 1000) + 1)
+            if event.type != pygame.NOEVENT:
+                events += [event]
+        return stamp_events(events + pygame.event.get())
+
+    def frame_done(self, dirty_rects, animating=False):
+        """
+        Schedule the next frame based on whether the last one drew anything.
+        Animations which skip frames keep the loop active with `animating`.
+        """
+        now = time.perf_counter()
+        self._updated = bool(dirty_rects)
+        self.idle = not dirty_rects and not animating
+        if self.idle:
+            self._next_frame = now + self.idle_time
+        else:
+            self._next_frame = max(self._next_frame + self.frame_time, now)
@@ -0,0 +1,204 @@
+import io
+import os
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seek_points (
+    hash TEXT PRIMARY KEY,
+    samplerate INTEGER NOT NULL,
+    frame_samples INTEGER NOT NULL,
+    offsets BLOB NOT NULL
+);
+"""
+
+# Bytes read from the start of a WAV file to find its data chunk
+WAV_HEADER_SIZE = 64 * 1024
+
+# MPEG audio frame header fields:
+# http://www.mp3-tech.org/programmer/frame_header.html
+MPEG_VERSIONS = {0: 2.5, 2: 2, 3: 1}
+LAYER_3 = 1
+LAYER_3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+SAMPLERATES = {
+    1: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    2.5: (11025, 12000, 8000),
+}
+
+
+def _id3v2_size(data):
+    # Size of the ID3v2 tag in front of the first frame
+    if data[:3] != b"ID3" or len(data) < 10:
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _mp3_frame(data, position):
+    # Returns (length, samplerate, samples) of the frame at position,
+    # or None if there is no valid Layer III frame header there.
+    header = int.from_bytes(data[position : position + 4], "big")
+    if header >> 21 != 0x7FF:
+        return None
+    version = MPEG_VERSIONS.get((header >> 19) & 0x3)
+    layer = (header >> 17) & 0x3
+    bitrate_index = (header >> 12) & 0xF
+    samplerate_index = (header >> 10) & 0x3
+    if version is None or layer != LAYER_3:
+        return None
+    if bitrate_index in (0, 15) or samplerate_index == 3:
+        return None
+    bitrate = LAYER_3_BITRATES[1 if version == 1 else 2][bitrate_index] * 1000
+    samplerate = SAMPLERATES[version][samplerate_index]
+    padding = (header >> 9) & 0x1
+    if version == 1:
+        return 144 * bitrate // samplerate + padding, samplerate, 1152
+    return 72 * bitrate // samplerate + padding, samplerate, 576
+
+
+def scan_mp3(data):
+    """
+    Find byte offsets of all audio frames in MP3 data.
+    Returns (samplerate, samples per frame, offsets).
+    """
+    position = _id3v2_size(data)
+    offsets = array("I")
+    samplerate, frame_samples = 0, 0
+    while position + 4 <= len(data):
+        frame = _mp3_frame(data, position)
+        if frame is None:
+            # Lost sync, look for the next frame header
+            position += 1
+            continue
+        length, samplerate, frame_samples = frame
+        offsets.append(position)
+        position += length
+    # Xing/Info/VBRI header frame carries no audio
+    if offsets:
+        first_frame = data[offsets[0] : offsets[0] + 64]
+        if any(tag in first_frame for tag in (b"Xing", b"Info", b"VBRI")):
+            del offsets[0]
+    return samplerate, frame_samples, offsets
+
+
+def parse_wav(header):
+    """Returns (fmt chunk, data offset, data size) from the start of a WAV file."""
+    if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        raise ValueError("Not a WAV file!")
+    fmt = None
+    position = 12
+    while position + 8 <= len(header):
+        chunk_id = header[position : position + 4]
+        size = int.from_bytes(header[position + 4 : position + 8], "little")
+        if chunk_id == b"fmt ":
+            fmt = bytes(header[position + 8 : position + 8 + size])
+        elif chunk_id == b"data" and fmt is not None:
+            return fmt, position + 8, size
+        position += 8 + size + (size & 1)
+    raise ValueError("WAV data chunk not found!")
+
+
+def build_wav(fmt, data):
+    """Wrap raw frames into a WAV file with the given fmt chunk."""
+    return b"".join(
+        [
+            b"RIFF",
+            (4 + 8 + len(fmt) + 8 + len(data)).to_bytes(4, "little"),
+            b"WAVE",
+            b"fmt ",
+            len(fmt).to_bytes(4, "little"),
+            fmt,
+            b"data",
+            len(data).to_bytes(4, "little"),
+            data,
+        ]
+    )
+
+
+def _wav_from(data, offset):
+    # Cut WAV data at the given offset (in seconds)
+    fmt, data_offset, data_size = parse_wav(data)
+    samplerate = int.from_bytes(fmt[4:8], "little")
+    block_align = int.from_bytes(fmt[12:14], "little")
+    start = data_offset + int(offset * samplerate) * block_align
+    end = min(data_offset + data_size, len(data))
+    return build_wav(fmt, data[min(start, end) : end])
+
+
+class SeekIndex:
+    """
+    Starts songs at any offset without decoding them from the start.
+    MP3 files get a table of frame offsets, built once per file content
+    and kept in the library index, so seeking is a lookup followed by
+    reading from an exact frame boundary. WAV files and decoded buffers
+    are cut directly, as their frames have a fixed size.
+    """
+
+    def __init__(self, library):
+        self.library = library
+        self.library.create_tables(SCHEMA)
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="pytune-seek"
+        )
+
+    def _mp3_points(self, song):
+        info = self.library.info(song)
+        song_hash = info["hash"] if info is not None else None
+        rows = self.library.execute(
+            "SELECT samplerate, frame_samples, offsets FROM seek_points WHERE hash = ?",
+            (song_hash,),
+        )
+        if rows:
+            samplerate, frame_samples, blob = rows[0]
+            offsets = array("I")
+            offsets.frombytes(blob)
+            return samplerate, frame_samples, offsets
+        # Build the index and keep it for later:
+        with open(os.path.join(self.library.path, song), "rb") as file:
+            samplerate, frame_samples, offsets = scan_mp3(file.read())
+        if song_hash is not None and offsets:
+            self.library.execute(
+                "INSERT OR REPLACE INTO seek_points VALUES (?, ?, ?, ?)",
+                (song_hash, samplerate, frame_samples, offsets.tobytes()),
+            )
+        return samplerate, frame_samples, offsets
+
+    def prepare(self, songs):
+        """Build missing MP3 seek indices in the background."""
+        for song in songs:
+            if song.lower().endswith(".mp3"):
+                self._executor.submit(self._mp3_points, song)
+
+    def open_at(self, song, offset, buffer=None):
+        """
+        Returns (file object, name hint) of the song starting at offset
+        (in seconds). Uses the decoded buffer of the song if there is one.
+        """
+        if buffer is not None:
+            return io.BytesIO(_wav_from(buffer.getbuffer(), offset)), "wav"
+        path = os.path.join(self.library.path, song)
+        if song.lower().endswith(".mp3"):
+            samplerate, frame_samples, offsets = self._mp3_points(song)
+            if not offsets:
+                raise ValueError(f"No MP3 frames found in '{song}'!")
+            frame = min(int(offset * samplerate / frame_samples), len(offsets) - 1)
+            with open(path, "rb") as file:
+                file.seek(offsets[frame])
+                return io.BytesIO(file.read()), "mp3"
+        with open(path, "rb") as file:
+            fmt, data_offset, data_size = parse_wav(file.read(WAV_HEADER_SIZE))
+            samplerate = int.from_bytes(fmt[4:8], "little")
+            block_align = int.from_bytes(fmt[12:14], "little")
+            skipped = min(int(offset * samplerate) * block_align, data_size)
+            file.seek(data_offset + skipped)
+            data = file.read(data_size - skipped)
+            return io.BytesIO(build_wav(fmt, data)), "wav"
+
+    def close(self):
+        # Let the running scan finish before the library is closed
+        self._executor.shutdown(wait=True, cancel_futures=True)
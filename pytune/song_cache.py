@@ -0,0 +1,104 @@
+import io
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import soundfile
+
+from .logger import init_logger
+
+
+logger = init_logger(__name__)
+
+
+def decode_song(path):
+    """Decode a song file into bytes of an in-memory 16-bit WAV file."""
+    data, samplerate = soundfile.read(path, dtype="int16", always_2d=True)
+    buffer = io.BytesIO()
+    soundfile.write(buffer, data, samplerate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+class SongCache:
+    """
+    Decodes upcoming songs on a worker thread and keeps them in memory,
+    so starting a round is a buffer switch instead of opening and
+    decoding a file. Least recently used songs are evicted once the
+    total size of buffers exceeds the budget (in bytes).
+    """
+
+    def __init__(self, budget=512 * 1024**2, workers=1):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.decoded = 0
+        self.decode_time = 0.0
+        self._buffers = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="pytune-decode"
+        )
+
+    def prefetch(self, paths):
+        """Schedule decoding of songs that are not cached or decoding yet."""
+        with self._lock:
+            for path in paths:
+                if path in self._buffers or path in self._pending:
+                    continue
+                self._pending.add(path)
+                self._executor.submit(self._decode, path)
+
+    def _decode(self, path):
+        start = time.perf_counter()
+        try:
+            data = decode_song(path)
+        except (OSError, RuntimeError) as error:
+            # Song will be loaded from disk when played
+            logger.warning("Cannot decode '%s': %s", path, error)
+            data = None
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._pending.discard(path)
+            self.decode_time += elapsed
+            if data is None or len(data) > self.budget:
+                return
+            self.decoded += 1
+            self._buffers[path] = data
+            self.size += len(data)
+            # Evict least recently used songs to fit into the budget:
+            while self.size > self.budget:
+                _, evicted = self._buffers.popitem(last=False)
+                self.size -= len(evicted)
+
+    def get(self, path):
+        """Return the decoded song as a file object, or None if it is not ready."""
+        with self._lock:
+            data = self._buffers.get(path)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._buffers.move_to_end(path)
+        return io.BytesIO(data)
+
+    @property
+    def hit_rate(self):
+        requests = self.hits + self.misses
+        return self.hits / requests if requests > 0 else 0.0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "decoded": self.decoded,
+            "decode_time": self.decode_time,
+            "avg_decode_time": self.decode_time / max(self.decoded, 1),
+            "size": self.size,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
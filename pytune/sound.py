@@ -1,54 +1,274 @@
+import io
 import os
-from random import shuffle
+from collections import deque
+from random import uniform
+
+import numpy as np
 import pygame
+import soundfile
 
+from .fingerprint import DuplicateFinder
+from .library import SongLibrary
 from .logger import init_logger
+from .loudness import LoudnessAnalyzer
+from .metadata import MetadataIndex, format_track
+from .playback import MixerBackend, reserve_channels
+from .rotation import Rotation
+from .seek import SeekIndex
+from .song_cache import SongCache
 
 
 logger = init_logger(__name__)
 
+# Random start offsets leave at least this much of the song (in seconds)
+MIN_CLIP_LENGTH = 30.0
+
+MIXER_FREQUENCY = 44100
+# Mixer channels of sound effects, channel 0 plays songs from memory
+BUZZ_CHANNEL = 1
+STING_CHANNEL = 2
+# Pitches of player buzzes (in Hz), pentatonic scale from C5 over 3 octaves
+BUZZ_NOTES = [
+    523.25 * 2**octave * ratio
+    for octave in range(3)
+    for ratio in (1.0, 9 / 8, 5 / 4, 3 / 2, 5 / 3)
+]
+
+
+def mixer_buffer(latency, frequency=MIXER_FREQUENCY):
+    """Largest power of two mixer buffer (in frames) within the latency budget."""
+    frames = 256
+    while frames * 2 <= latency * frequency:
+        frames *= 2
+    return frames
+
+
+def _note(pitch, duration, rate, square=False):
+    time = np.arange(int(duration * rate)) / rate
+    wave = np.sin(2 * np.pi * pitch * time)
+    if square:
+        wave = np.sign(wave) * 0.5
+    # Fast attack, exponential decay and a short fade out to avoid clicks
+    envelope = np.minimum(time / 0.005, 1.0) * np.exp(-time * 5 / duration)
+    envelope[-64:] *= np.linspace(1.0, 0.0, 64)
+    return wave * envelope
+
+
+class SoundEffects:
+    """
+    Buzzes of players and stings of host decisions. Sounds are generated
+    and loaded into pygame.mixer.Sound objects ahead of time, and play on
+    reserved channels, so they start within one mixer buffer and never
+    take the channel of a song or interrupt pygame.mixer.music.
+    """
+
+    def __init__(self, players=0, volume=0.5):
+        if not pygame.mixer.get_init():
+            raise RuntimeError("Mixer is not initialized!")
+        self.rate, _, self.channels = pygame.mixer.get_init()
+        self.volume = volume
+        reserve_channels(STING_CHANNEL + 1)
+        self.buzz_channel = pygame.mixer.Channel(BUZZ_CHANNEL)
+        self.sting_channel = pygame.mixer.Channel(STING_CHANNEL)
+        self._buzzes = []
+        self.preload(players)
+        rate = self.rate
+        self._right = self._make_sound(
+            np.concatenate(
+                [_note(pitch, 0.09, rate) for pitch in (523.25, 659.25, 783.99)]
+                + [_note(1046.5, 0.3, rate)]
+            )
+        )
+        self._wrong = self._make_sound(
+            np.concatenate(
+                [
+                    _note(196.0, 0.2, rate, square=True),
+                    _note(146.83, 0.4, rate, square=True),
+                ]
+            )
+        )
+
+    def _make_sound(self, samples):
+        data = np.repeat((samples * self.volume)[:, None], self.channels, axis=1)
+        # WAV data lets SDL convert the sound to any mixer format
+        buffer = io.BytesIO()
+        soundfile.write(buffer, data, self.rate, format="WAV", subtype="PCM_16")
+        buffer.seek(0)
+        return pygame.mixer.Sound(file=buffer)
+
+    def preload(self, players):
+        """Make sure buzzes of that many players are ready."""
+        while len(self._buzzes) < players:
+            pitch = BUZZ_NOTES[len(self._buzzes) % len(BUZZ_NOTES)]
+            self._buzzes += [self._make_sound(_note(pitch, 0.15, self.rate))]
+
+    def buzz(self, player):
+        self.preload(player + 1)
+        self.buzz_channel.play(self._buzzes[player])
+
+    def right(self):
+        self.sting_channel.play(self._right)
+
+    def wrong(self):
+        self.sting_channel.play(self._wrong)
+
 
 class Sound:
-    def __init__(self, path, random_order=True):
+    def __init__(
+        self,
+        path,
+        random_order=True,
+        prefetch=2,
+        backend=None,
+        random_offset=False,
+        normalize=True,
+        analyze=True,
+    ):
         self.path = path
-        self.songs = self._load_songs(self.path, random_order)
+        self.backend = MixerBackend() if backend is None else backend
+        self.library = SongLibrary(path)
+        # Copies of the same song are played only once:
+        self.fingerprints = DuplicateFinder(self.library)
+        # Songs found by the background scan, queued on the next song:
+        self._found_songs = deque()
+        songs = self._load_songs()
+        # Songs played in earlier sessions come back less often:
+        self.rotation = Rotation(self.library, songs, random_order)
         self.current_song = None
+        # Decoded buffer (bytes) or path of the playing song and its start offset
+        self.current_audio = None
+        # Tags of the playing song, read in the background for all songs:
+        self.current_track = None
+        self.metadata = MetadataIndex(self.library)
+        # Decode upcoming songs in the background:
+        self.prefetch = prefetch
+        # Upcoming songs go first to the analysis:
+        songs = list(dict.fromkeys(self.rotation.upcoming(prefetch) + songs))
+        self.cache = SongCache()
+        # Start songs from a random point:
+        self.random_offset = random_offset
+        self.seek_index = SeekIndex(self.library)
+        # Even out loudness differences between songs:
+        self.normalize = normalize
+        self.loudness = LoudnessAnalyzer(self.library)
+        if self.normalize:
+            self.loudness.analyze_in_background(songs)
+        # Fingerprints and tags of new songs, off e.g. for benchmarks:
+        if analyze:
+            self.fingerprints.analyze_in_background(songs)
+            self.metadata.extract_in_background(songs)
+        self._prefetch_songs()
 
-    def _load_songs(self, path, random_order):
-        # Check if the folder exists
-        if not os.path.exists(path):
-            raise OSError(f"Folder '{path}' does not exist!")
-        files = os.listdir(path)
-        # Filter out music files
-        songs = [file for file in files if file.endswith((".mp3", ".wav"))]
-        if random_order:
-            shuffle(songs)
-        return songs
-
-    def play_next_song(self):
+    def _load_songs(self):
+        songs = self.library.songs()
+        if songs:
+            # Start with songs known from the last run, songs added
+            # since then join the rotation when the rescan finds them.
+            # They are analyzed in the next session.
+            self.library.refresh_in_background(self._found_songs.extend)
+        else:
+            # First run, the folder needs to be indexed:
+            self.library.refresh()
+            songs = self.library.songs()
+        return self.fingerprints.deduplicate(songs)
+
+    def skip_songs(self, songs):
+        """Remove songs (e.g. played in a restored game) from the queue."""
+        self.rotation.remove(songs)
+        self._prefetch_songs()
+
+    def _prefetch_songs(self):
+        upcoming = self.rotation.upcoming(self.prefetch)
+        self.cache.prefetch([os.path.join(self.path, song) for song in upcoming])
+        if self.random_offset:
+            self.seek_index.prepare(upcoming)
+
+    def _random_offset(self, song):
+        info = self.library.info(song)
+        if info is None or info["duration"] is None:
+            return 0.0
+        return uniform(0.0, max(info["duration"] - MIN_CLIP_LENGTH, 0.0))
+
+    def play_next_song(self, offset=None):
         # Free resources if possible:
-        try:
-            pygame.mixer.music.unload()
-        except:
-            pass
-        # Get the next song from the list:
-        try:
-            self.current_song = self.songs.pop(0)
-        except IndexError:
-            logger.game("No more songs! The game ends here!")
-            return 1
+        self.backend.unload()
+        if self._found_songs:
+            found = []
+            while self._found_songs:
+                found += [self._found_songs.popleft()]
+            self.rotation.add(found)
+        # Get the next song from the list, skipping songs removed
+        # since the last scan and copies found during the game:
+        while True:
+            self.current_song = self.rotation.next()
+            if self.current_song is None:
+                logger.game("No more songs! The game ends here!")
+                return 1
+            if self.current_song in self.fingerprints.duplicates:
+                continue
+            if os.path.exists(os.path.join(self.path, self.current_song)):
+                break
         # Play song and log info:
-        logger.song(f"Playing: {self.current_song}")
-        pygame.mixer.music.load(os.path.join(self.path, self.current_song))
-        pygame.mixer.music.play()
+        if offset is None and self.random_offset:
+            offset = self._random_offset(self.current_song)
+        self.current_track = self.metadata.get(self.current_song)
+        logger.song("Playing: %s", self.current_song)
+        logger.song("Track: %s", format_track(self.current_track))
+        self.rotation.record(self.current_song)
+        song_path = os.path.join(self.path, self.current_song)
+        # Switch to the decoded buffer if the song was prefetched:
+        buffer = self.cache.get(song_path)
+        source = None
+        if offset:
+            try:
+                source = self.seek_index.open_at(self.current_song, offset, buffer)
+                logger.sound("Starting at %.1fs", offset)
+            except (ValueError, OSError) as error:
+                # Odd files still play, only from the start
+                logger.warning(
+                    "Cannot start '%s' at %.1fs: %s", self.current_song, offset, error
+                )
+                offset = 0.0
+        # Unmodified BytesIO returns its bytes without a copy:
+        self.current_audio = (
+            song_path if buffer is None else buffer.getvalue(),
+            offset or 0.0,
+        )
+        if source is not None:
+            self.backend.load(*source)
+        elif buffer is not None:
+            self.backend.load(buffer, "wav")
+        else:
+            self.backend.load(song_path)
+        if self.normalize:
+            self.backend.set_gain(self.loudness.gain(self.current_song))
+        self.backend.play()
+        self._prefetch_songs()
         return 0
 
     def continue_current_song(self):
-        logger.sound(f"Continuing: {self.current_song}")
-        pygame.mixer.music.unpause()
+        logger.sound("Continuing: %s", self.current_song)
+        self.backend.unpause()
         return 0
 
     def pause_current_song(self):
-        logger.sound(f"Stopping: {self.current_song}")
-        pygame.mixer.music.pause()
+        logger.sound("Stopping: %s", self.current_song)
+        self.backend.pause()
         return 0
+
+    def close(self):
+        stats = self.cache.stats()
+        logger.sound(
+            "Song cache: %.0f%% hit rate, %d decoded in %.2fs",
+            stats["hit_rate"] * 100,
+            stats["decoded"],
+            stats["decode_time"],
+        )
+        self.backend.unload()
+        self.cache.close()
+        self.seek_index.close()
+        self.loudness.close()
+        self.fingerprints.close()
+        self.metadata.close()
+        self.rotation.flush()
+        self.library.close()
@@ -0,0 +1,353 @@
+"""
+Spectrum of the playing song, drawn as bars at the bottom of the host card.
+
+The visualizer runs in the game loop, so its work per frame has a time
+budget. Over budget it drops to fewer bands and skips frames, and it
+goes back once there is time to spare again.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pygame
+import soundfile
+
+from .logger import init_logger
+from .seek import parse_wav
+
+
+logger = init_logger(__name__)
+
+FFT_SIZE = 2048
+# New spectrum is computed once the song moved by this many frames
+HOP_SIZE = FFT_SIZE // 2
+LOWEST_FREQUENCY = 60.0
+HIGHEST_FREQUENCY = 12000.0
+# Bands quieter than this (in dB relative to a full scale sine) are empty
+FLOOR_DB = -60.0
+# Bars fall by this fraction of their height per update
+FALL_RATE = 0.15
+# Quality levels as (bands, frames between updates), best first
+QUALITY_LEVELS = ((32, 1), (24, 1), (16, 2), (8, 3), (8, 6))
+# Frames over budget before the quality drops
+OVER_BUDGET_FRAMES = 3
+# Frames well under budget before the quality goes up again
+UNDER_BUDGET_FRAMES = 90
+
+
+class SongReader:
+    """
+    Reads windows of a song file on a worker thread, so the game loop
+    never waits for the disk. The file is opened, read and closed only
+    by the worker, a block requested by one update is taken by a later one.
+    """
+
+    def __init__(self, path):
+        self._file = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="pytune-visualizer"
+        )
+        self._opening = self._executor.submit(self._open, path)
+        self._pending = None
+
+    def _open(self, path):
+        self._file = soundfile.SoundFile(path)
+        return self._file.samplerate
+
+    def _read(self, start):
+        self._file.seek(min(start, self._file.frames))
+        return self._file.read(FFT_SIZE, dtype="float32", always_2d=True)
+
+    def samplerate(self):
+        """Sample rate of the song, None until the file is open."""
+        if not self._opening.done():
+            return None
+        return self._opening.result()
+
+    def read(self, start):
+        """
+        Block of the last request if it is ready, otherwise None.
+        A new block starting at `start` is requested either way, unless
+        the last request is still being read.
+        """
+        block = None
+        if self._pending is not None:
+            if not self._pending.done():
+                return None
+            block = self._pending.result()
+        self._pending = self._executor.submit(self._read, start)
+        return block
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def close(self):
+        if self._pending is not None:
+            self._pending.cancel()
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=False)
+
+
+class Visualizer:
+    """
+    Spectrum bars of the playing song.
+    Samples are read from the decoded buffer of the song when it was
+    cached, otherwise from the song file by a SongReader. Backends do
+    not report the playback position, so it is kept on the perf_counter
+    clock.
+    """
+
+    def __init__(self, budget=0.002):
+        self.budget = budget  # Time for an update and a draw (in seconds)
+        self.level = 0
+        self.running = False  # Song plays or bars are still falling
+        self.spent = 0.0  # Time of the last update and draw
+        self._samples = None  # Frames of a decoded song
+        self._reader = None  # Reader of a song file, if it was not decoded
+        self._samplerate = 44100
+        self._scale = 1.0  # Full scale of sample values
+        self._offset = 0.0  # Position at the last start or pause (in seconds)
+        self._started_at = None  # None while paused
+        self._last_frame = None  # Song frame of the last spectrum
+        self._frame_count = 0
+        self._over_budget = 0
+        self._under_budget = 0
+        self._changed = False
+        # Preallocated buffers of the analysis:
+        self._mono = np.zeros(FFT_SIZE, dtype=np.float32)
+        self._window = np.hanning(FFT_SIZE).astype(np.float32)
+        self._levels = {
+            bands: np.zeros(bands, dtype=np.float32) for bands, _ in QUALITY_LEVELS
+        }
+        self._edges = {}
+        # Full scale sine gives this power in the peak bin of a Hann window:
+        self._reference = (FFT_SIZE / 4) ** 2
+        # Pre-built bars by size of the strip, band count and color
+        self._bars = {}
+
+    @property
+    def levels(self):
+        return self._levels[QUALITY_LEVELS[self.level][0]]
+
+    def start(self, source, offset=0.0):
+        """
+        Follow a song which started playing at offset (in seconds).
+        Source is the decoded WAV buffer (bytes) or the song path.
+        """
+        self.stop()
+        if isinstance(source, bytes):
+            try:
+                self._open_buffer(source)
+            except ValueError as error:
+                logger.debug("No spectrum of the song: %s", error)
+                self.stop()
+                return
+        else:
+            self._reader = SongReader(source)
+            self._scale = 1.0
+        self._offset = offset
+        self._started_at = time.perf_counter()
+        self._last_frame = None
+        self.running = True
+
+    def _open_buffer(self, data):
+        fmt, data_offset, data_size = parse_wav(data)
+        channels = int.from_bytes(fmt[2:4], "little")
+        bits = int.from_bytes(fmt[14:16], "little")
+        if bits != 16:
+            raise ValueError(f"{bits}-bit WAV buffer!")
+        # View of the buffer, no samples are copied:
+        count = min(data_size, len(data) - data_offset) // (2 * channels)
+        self._samples = np.frombuffer(
+            data, dtype=np.int16, count=count * channels, offset=data_offset
+        ).reshape(-1, channels)
+        self._samplerate = int.from_bytes(fmt[4:8], "little")
+        self._scale = 1 / 32768
+
+    def pause(self):
+        if self._started_at is not None:
+            self._offset = self.position(time.perf_counter())
+            self._started_at = None
+
+    def resume(self):
+        has_song = self._samples is not None or self._reader is not None
+        if self._started_at is None and has_song:
+            self._started_at = time.perf_counter()
+            self._last_frame = None
+            self.running = True
+
+    def stop(self):
+        self._started_at = None
+        self._samples = None
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def position(self, now):
+        """Playback position in seconds."""
+        if self._started_at is None:
+            return self._offset
+        return self._offset + now - self._started_at
+
+    def _read(self, frame):
+        """
+        Mono samples of the window ending at the given frame. Returns
+        False once the song is over and None while a file is being read.
+        """
+        start = max(frame - FFT_SIZE, 0)
+        if self._samples is not None:
+            block = self._samples[start : start + FFT_SIZE]
+        else:
+            try:
+                block = self._reader.read(start)
+            except (OSError, RuntimeError) as error:
+                logger.debug("Song cannot be read any further: %s", error)
+                return False
+            if block is None:
+                return None
+        count = len(block)
+        if not count:
+            return False
+        np.mean(block, axis=1, dtype=np.float32, out=self._mono[:count])
+        self._mono[count:] = 0
+        self._mono *= self._scale
+        return True
+
+    def _band_edges(self, bands):
+        edges = self._edges.get((bands, self._samplerate))
+        if edges is None:
+            frequencies = np.geomspace(LOWEST_FREQUENCY, HIGHEST_FREQUENCY, bands + 1)
+            edges = np.rint(frequencies * FFT_SIZE / self._samplerate).astype(int)
+            # Every band gets at least one bin:
+            edges = np.maximum(edges, edges[0] + np.arange(bands + 1))
+            edges = np.minimum(edges, FFT_SIZE // 2)
+            self._edges[(bands, self._samplerate)] = edges
+        return edges
+
+    def _analyze(self, levels):
+        self._mono *= self._window
+        power = np.square(np.abs(np.fft.rfft(self._mono)))
+        energy = np.add.reduceat(power, self._band_edges(len(levels))[:-1])
+        decibels = 10 * np.log10(energy / self._reference + 1e-12)
+        np.maximum(levels, np.clip(1 - decibels / FLOOR_DB, 0.0, 1.0), out=levels)
+
+    def _ready(self):
+        # Song file needs to be opened by its reader first
+        if self._reader is None:
+            return True
+        try:
+            samplerate = self._reader.samplerate()
+        except (OSError, RuntimeError) as error:
+            logger.debug("No spectrum of the song: %s", error)
+            self.stop()
+            return False
+        if samplerate is None:
+            return False
+        self._samplerate = samplerate
+        return True
+
+    def update(self):
+        """Compute new bar heights, if this frame has an update."""
+        if not self.running:
+            return
+        self._frame_count += 1
+        if self._frame_count % QUALITY_LEVELS[self.level][1]:
+            return
+        start = time.perf_counter()
+        levels = self.levels
+        levels *= 1 - FALL_RATE
+        if self._started_at is not None:
+            frame = None
+            if self._ready():
+                frame = int(self.position(start) * self._samplerate)
+            # Windows overlap by half, a smaller move needs no new spectrum:
+            if frame is not None and (
+                self._last_frame is None or abs(frame - self._last_frame) >= HOP_SIZE
+            ):
+                found = self._read(frame)
+                if found:
+                    self._analyze(levels)
+                elif found is False:
+                    # Song is over or cannot be read, let the bars fall
+                    self.pause()
+                if found is not None:
+                    self._last_frame = frame
+        elif levels.max() < 0.01:
+            # Paused and all bars fell down, nothing to draw anymore
+            levels.fill(0)
+            self.running = False
+        self._changed = True
+        self.spent = time.perf_counter() - start
+
+    def _bar(self, size, bands, color):
+        key = (size, bands, color)
+        bar = self._bars.get(key)
+        if bar is None:
+            if len(self._bars) >= 2 * len(QUALITY_LEVELS):
+                self._bars.clear()
+            width, height = size[0] // bands, size[1]
+            bar = pygame.Surface((max(width - 1, 1), height)).convert()
+            # Bars get lighter towards the top:
+            for row in range(height):
+                shade = 1.0 - 0.4 * row / max(height - 1, 1)
+                pygame.draw.line(
+                    bar,
+                    tuple(int(channel * shade) for channel in color),
+                    (0, row),
+                    (width, row),
+                )
+            self._bars[key] = bar
+        return bar
+
+    def draw(self, window, rect, background, color, force=False):
+        """
+        Draw the bars into rect of the window if they changed, or if
+        force is set because the area was painted over.
+        Returns the rectangle that needs a display update or None.
+        """
+        changed = self._changed
+        if not changed and not (force and self.running):
+            return None
+        start = time.perf_counter()
+        levels = self.levels
+        bar = self._bar(rect.size, len(levels), color)
+        width = rect.width // len(levels)
+        window.fill(background, rect)
+        for band, level in enumerate(levels):
+            height = int(level * rect.height)
+            if height:
+                window.blit(
+                    bar,
+                    (rect.left + band * width, rect.bottom - height),
+                    (0, rect.height - height, bar.get_width(), height),
+                )
+        self._changed = False
+        if changed:
+            self.spent += time.perf_counter() - start
+            self._adapt(self.spent)
+        return rect
+
+    def _adapt(self, spent):
+        # Change quality only after a few frames, single slow ones happen
+        if spent > self.budget:
+            self._over_budget += 1
+            self._under_budget = 0
+        elif spent < self.budget / 4:
+            self._under_budget += 1
+            self._over_budget = 0
+        else:
+            self._over_budget = self._under_budget = 0
+        level = self.level
+        if self._over_budget >= OVER_BUDGET_FRAMES:
+            level = min(level + 1, len(QUALITY_LEVELS) - 1)
+        elif self._under_budget >= UNDER_BUDGET_FRAMES:
+            level = max(level - 1, 0)
+        if level != self.level:
+            self._over_budget = self._under_budget = 0
+            self.level = level
+            self.levels.fill(0)
+            logger.debug(
+                "Visualizer uses %s bands every %s frames", *QUALITY_LEVELS[level]
+            )
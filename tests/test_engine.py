@@ -0,0 +1,109 @@
+from pytune.engine import (
+    NO_EFFECTS,
+    Actors,
+    Effect,
+    Engine,
+    GameState,
+    Input,
+    simulate,
+)
+from pytune.player import HostState, PlayerState
+
+
+def kinds(effects):
+    return [effect[0] for effect in effects]
+
+
+def test_space_starts_and_skips_rounds():
+    engine = Engine(2)
+    assert kinds(engine.handle(Input.SPACE)) == [
+        Effect.HIGHLIGHT_HOST,
+        Effect.RESET_PLAYERS,
+        Effect.PLAY_NEXT,
+    ]
+    assert engine.state is GameState.MUSIC_ROUND
+    assert engine.round_counter == 1
+    assert Effect.SKIPPED in kinds(engine.handle(Input.SPACE))
+    assert engine.state is GameState.IDLE
+
+
+def test_buzz_stops_the_song_for_ranking():
+    engine = Engine(2)
+    assert engine.handle(Input.BUZZ, 0, 1.0, 1.0) is NO_EFFECTS
+    engine.handle(Input.SPACE)
+    effects = engine.handle(Input.BUZZ, 1, 2.0, 2.0)
+    assert effects[0] == (Effect.PAUSE_SONG,)
+    assert (Effect.BUZZED, 1, False) in effects
+    assert (Effect.HIGHLIGHT_HOST, True, HostState.RANKING) in effects
+    assert engine.state is GameState.RANKING_ROUND
+    assert engine.who_stopped == 1
+    assert engine.stopped_at == 2.0
+    # Later presses are ignored while the answer is ranked:
+    assert engine.handle(Input.BUZZ, 0, 2.5, 2.5) is NO_EFFECTS
+    assert engine.handle(Input.SPACE) is NO_EFFECTS
+
+
+def test_earlier_press_takes_over_within_grace():
+    engine = Engine(2, buzz_grace=0.1)
+    engine.handle(Input.SPACE)
+    engine.handle(Input.BUZZ, 1, 2.0, 2.0)
+    effects = engine.handle(Input.BUZZ, 0, 1.9, 2.05)
+    assert effects == (
+        (Effect.HIGHLIGHT_PLAYER, 1, False, PlayerState.ACTIVE),
+        (Effect.BUZZED, 0, True),
+        (Effect.HIGHLIGHT_PLAYER, 0, True, PlayerState.ANSWERING),
+    )
+    assert engine.who_stopped == 0
+    # Too late, even though pressed earlier:
+    assert engine.handle(Input.BUZZ, 1, 1.0, 2.5) is NO_EFFECTS
+
+
+def test_plus_ends_the_round():
+    engine = Engine(2)
+    engine.handle(Input.SPACE)
+    engine.handle(Input.BUZZ, 1, 1.0, 1.0)
+    assert engine.handle(Input.PLUS)[0] == (Effect.SCORED, 1, 1)
+    assert engine.points == [0, 1]
+    assert engine.state is GameState.IDLE
+    assert engine.who_stopped is Actors.HOST
+    assert engine.handle(Input.PLUS) is NO_EFFECTS
+
+
+def test_minus_eliminates_the_player_for_the_round():
+    engine = Engine(2)
+    engine.handle(Input.SPACE)
+    engine.handle(Input.BUZZ, 0, 1.0, 1.0)
+    assert engine.handle(Input.MINUS)[0] == (Effect.SCORED, 0, -1)
+    assert engine.points == [-1, 0]
+    assert engine.state is GameState.MUSIC_ROUND
+    assert engine.disabled_players == {0}
+    assert engine.handle(Input.BUZZ, 0, 2.0, 2.0) is NO_EFFECTS
+    # Next round brings the player back:
+    engine.handle(Input.SPACE)
+    engine.handle(Input.SPACE)
+    assert engine.disabled_players == set()
+
+
+def test_host_controls_music_outside_ranking():
+    engine = Engine(1)
+    assert Effect.PAUSE_SONG in kinds(engine.handle(Input.PAUSE))
+    assert Effect.CONTINUE_SONG in kinds(engine.handle(Input.CONTINUE))
+    engine.handle(Input.SPACE)
+    engine.handle(Input.BUZZ, 0, 1.0, 1.0)
+    assert engine.handle(Input.CONTINUE) is NO_EFFECTS
+
+
+def test_added_and_restored_players():
+    engine = Engine(1)
+    assert engine.add_player() == 1
+    engine.restore({0: 3, 1: -1, 5: 2}, 7)
+    assert engine.points == [3, -1]
+    assert engine.round_counter == 7
+    engine.handle(Input.SPACE)
+    assert (Effect.BUZZED, 1, False) in engine.handle(Input.BUZZ, 1, 1.0, 1.0)
+
+
+def test_simulate_is_repeatable():
+    points = simulate(4, 1000, seed=3)
+    assert points == simulate(4, 1000, seed=3)
+    assert len(points) == 4
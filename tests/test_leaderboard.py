@@ -0,0 +1,40 @@
+import sqlite3
+
+import pytest
+
+from pytune.leaderboard import Leaderboard, RoundClock, head_to_head, season_totals
+
+
+def test_round_clock_counts_playing_time():
+    clock = RoundClock()
+    clock.start(10.0)
+    assert clock.played(12.0) == pytest.approx(2.0)
+    clock.pause(15.0)
+    assert clock.played(16.0) == pytest.approx(5.0)
+    # Press made before the pause was handled:
+    assert clock.played(13.0) == pytest.approx(3.0)
+    assert clock.played(5.0) == 0.0
+    clock.resume(20.0)
+    clock.resume(21.0)  # Already playing, nothing changes
+    assert clock.played(22.0) == pytest.approx(7.0)
+    clock.start(30.0)
+    assert clock.played(30.5) == pytest.approx(0.5)
+
+
+def test_resumed_game_counts_once(tmp_path):
+    path = str(tmp_path / "league.sqlite")
+    first = Leaderboard(path, "2026", ["Ann", "Bob"])
+    first.record_round([(1, "Ann", 1, 2.0, "song.mp3")])
+    first.close()
+    resumed = Leaderboard(path, players=["Ann", "Bob"], game=first.game)
+    assert resumed.season == "2026"
+    resumed.record_round([(2, "Bob", -1, 1.0, "other.mp3")])
+    resumed.close()
+
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT COUNT(*) FROM games").fetchone() == (1,)
+    standings = {standing.player: standing for standing in season_totals(db, "2026")}
+    assert standings["Ann"].games == standings["Bob"].games == 1
+    assert (standings["Ann"].points, standings["Bob"].points) == (1, -1)
+    assert head_to_head(db, "2026", "Ann", "Bob") == (1, 1, 0, 0)
+    db.close()
@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from pytune.library import SongLibrary
+from pytune.rotation import FRESH_WEIGHT, FenwickTree, Rotation
+
+
+def brute_find(weights, value):
+    for position, weight in enumerate(weights):
+        if value < weight:
+            return position
+        value -= weight
+    raise AssertionError("value out of range")
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 8, 13, 64])
+def test_fenwick_matches_prefix_sums(size):
+    rng = random.Random(size)
+    weights = [rng.randrange(0, 10) for _ in range(size)]
+    weights[0] += 1  # Total is never zero
+    tree = FenwickTree(weights)
+    assert len(tree) == size
+    for _ in range(50):
+        position = rng.randrange(size)
+        weights[position] = rng.randrange(0, 10)
+        tree.update(position, weights[position])
+        assert tree.total() == sum(weights)
+        for value in range(tree.total()):
+            assert tree.find(value) == brute_find(weights, value)
+
+
+def test_fenwick_skips_zero_weights():
+    tree = FenwickTree([0, 3, 0, 0, 2])
+    assert [tree.find(value) for value in range(5)] == [1, 1, 1, 4, 4]
+    tree.update(1, 0)
+    assert tree.total() == 2
+    assert tree.find(0) == 4
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = SongLibrary(str(tmp_path), index_path=str(tmp_path / "index.sqlite"))
+    yield library
+    library.close()
+
+
+def test_rotation_draws_every_song_once(library):
+    songs = [f"song{number}.mp3" for number in range(20)]
+    rotation = Rotation(library, songs, seed=1)
+    assert rotation._tree.weights == [FRESH_WEIGHT] * 20
+    drawn = [rotation.next() for _ in range(20)]
+    assert sorted(drawn) == sorted(songs)
+    assert rotation.next() is None
+
+
+def test_rotation_keeps_order_without_random(library):
+    rotation = Rotation(library, ["a", "b", "c"], random_order=False)
+    assert rotation.upcoming(2) == ["a", "b"]
+    rotation.remove(["b"])
+    assert [rotation.next(), rotation.next(), rotation.next()] == ["a", "c", None]
+
+
+def test_rotation_adds_new_songs(library):
+    rotation = Rotation(library, ["a", "b"], random_order=False)
+    assert rotation.next() == "a"
+    rotation.add(["b", "c", "c"])
+    assert len(rotation) == 2
+    assert [rotation.next(), rotation.next(), rotation.next()] == ["b", "c", None]
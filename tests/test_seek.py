@@ -0,0 +1,88 @@
+import pytest
+
+from pytune.seek import _id3v2_size, _wav_from, build_wav, parse_wav, scan_mp3
+
+# MPEG 1 Layer III, 128 kbps, 44100 Hz, no padding: 417 bytes per frame
+FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0x64])
+FRAME_LENGTH = 144 * 128000 // 44100
+
+
+def mp3_frame(payload=b""):
+    return FRAME_HEADER + payload.ljust(FRAME_LENGTH - 4, b"\0")
+
+
+def id3_tag(size):
+    # Tag sizes are stored in 4 bytes of 7 bits
+    syncsafe = bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b"ID3\x04\x00\x00" + syncsafe + b"\0" * size
+
+
+def pcm_fmt(channels=2, samplerate=8000, bits=16):
+    block_align = channels * bits // 8
+    return b"".join(
+        [
+            (1).to_bytes(2, "little"),
+            channels.to_bytes(2, "little"),
+            samplerate.to_bytes(4, "little"),
+            (samplerate * block_align).to_bytes(4, "little"),
+            block_align.to_bytes(2, "little"),
+            bits.to_bytes(2, "little"),
+        ]
+    )
+
+
+def test_parse_wav_skips_other_chunks():
+    fmt = pcm_fmt()
+    data = bytes(range(16))
+    wav = build_wav(fmt, data)
+    # Odd sized chunk before the data, padded to an even size:
+    extra = b"LIST" + (3).to_bytes(4, "little") + b"abc\0"
+    wav = wav[:36] + extra + wav[36:]
+    assert parse_wav(wav) == (fmt, 36 + len(extra) + 8, len(data))
+
+
+@pytest.mark.parametrize(
+    "header", [b"", b"RIFF\0\0\0\0WAVX", build_wav(pcm_fmt(), b"")[:36]]
+)
+def test_parse_wav_rejects_odd_headers(header):
+    with pytest.raises(ValueError):
+        parse_wav(header)
+
+
+def test_wav_cut_at_offset():
+    fmt = pcm_fmt(channels=2, samplerate=8000)
+    frames = bytes(range(256)) * 125  # 8000 frames of 4 bytes, 1 s
+    wav = build_wav(fmt, frames)
+    cut = _wav_from(wav, 0.25)
+    assert parse_wav(cut)[0] == fmt
+    assert cut[44:] == frames[2000 * 4 :]
+    # Offsets after the end give an empty song:
+    assert parse_wav(_wav_from(wav, 2.0))[2] == 0
+
+
+def test_id3v2_size():
+    assert _id3v2_size(b"no tag here") == 0
+    assert _id3v2_size(id3_tag(300)) == 310
+
+
+def test_scan_mp3_finds_frames_after_tag_and_junk():
+    tag = id3_tag(100)
+    data = tag + mp3_frame() + b"\x12\x34" + mp3_frame() + mp3_frame()
+    samplerate, frame_samples, offsets = scan_mp3(data)
+    assert (samplerate, frame_samples) == (44100, 1152)
+    first = len(tag)
+    assert list(offsets) == [
+        first,
+        first + FRAME_LENGTH + 2,
+        first + 2 * FRAME_LENGTH + 2,
+    ]
+
+
+def test_scan_mp3_drops_xing_frame():
+    data = mp3_frame(b"\0" * 32 + b"Xing") + mp3_frame()
+    assert list(scan_mp3(data)[2]) == [FRAME_LENGTH]
+
+
+def test_scan_mp3_without_frames():
+    samplerate, frame_samples, offsets = scan_mp3(b"\0" * 1000)
+    assert (samplerate, frame_samples, list(offsets)) == (0, 0, [])